@@ -0,0 +1,57 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+#directory of the repository, the modules are imported as scripts from the directories they live in
+REPOSITORY_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+#modules to benchmark with the directory they are imported from, their import time budget in seconds and the heavy
+#packages they must not import, galaxy.py workers and the colour helpers are on the hot path so they only get NumPy
+#(and laspy for galaxy) while timeline.py is allowed astropy and scipy but not matplotlib
+BUDGETS = [
+    ('blackbody', 'util', 0.5, ['astropy', 'scipy', 'matplotlib']),
+    ('galaxy', 'src', 1.0, ['astropy', 'scipy', 'matplotlib']),
+    ('timeline', 'util', 4.0, ['matplotlib']),
+    ]
+
+#code run in a fresh interpreter to time one import and list the heavy packages it pulled in
+MEASURE_IMPORT = '''
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps([elapsed, sorted(set(name.split('.')[0] for name in sys.modules) & set({forbidden!r}))]))
+'''
+
+#import a module in a fresh interpreter and return the import time in seconds and the forbidden packages it imported
+def measure_import(module, directory, forbidden):
+    result = subprocess.run([sys.executable, '-c', MEASURE_IMPORT.format(module = module, forbidden = forbidden)],
+                            cwd = os.path.join(REPOSITORY_DIRECTORY, directory), capture_output = True, text = True,
+                            check = True)
+    elapsed, imported = json.loads(result.stdout.strip().splitlines()[-1])
+
+    return elapsed, imported
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Check the import time of each module against its budget')
+    parser.add_argument('--repeat', default = 5, type = int, help = 'Number of fresh interpreters per module, the fastest is kept')
+    args = parser.parse_args()
+
+    over_budget = False
+    for module, directory, budget, forbidden in BUDGETS:
+        measurements = [measure_import(module, directory, forbidden) for _ in range(args.repeat)]
+        elapsed = min(measurement[0] for measurement in measurements)
+        imported = measurements[0][1]
+
+        status = 'ok'
+        if elapsed > budget or imported:
+            status = 'OVER BUDGET' if elapsed > budget else 'IMPORTS ' + ', '.join(imported)
+            over_budget = True
+        print(module.ljust(10) + format(elapsed, '.3f').rjust(8) + ' s  budget ' + format(budget, '.1f') + ' s  ' + status)
+
+    sys.exit(1 if over_budget else 0)
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,26 @@
+import argparse
+import collections
+import itertools
 import math
+import multiprocessing
+import numpy as np
 import csv
 import os
+import shutil
+import sys
 import laspy
 import traceback
+import manifest
+import memory
+import render
+import stats
+import tiles
+import writers
 
 #local file location of GaiaSource files
 #the files can be found for download here:
 #http://cdn.gea.esac.esa.int/Gaia/gedr3/gaia_source/
-file_directory = 'E:\GaiaSource'
+file_directory = r'E:\GaiaSource'
 
 #constants and their units
 WEIN_CONSTANT = 2897771.9 #nM K
@@ -15,111 +28,614 @@ BOLTZMANN_CONSTANT = 1.380649e-23 #J/(K)
 PLANCK_CONSTANT = 6.62607015e-34 #J s
 LIGHT_SPEED_CONSTANT = 29979245800 #cm/(s)
 
-#matrix of polynomial co-efficients for temperature to rgb conversion in ascending order of degree
-POLYNOMIAL_COEFFICIENTS = [
-    [202.7407364067034, -26.810279254200008, 17.92772958298324, -9.45648666312952, 1.6236384714807253], 
-    [218.60561513620232, 52.17192901392309, -23.061733295188585, 54.04865637275284, -51.058826067299464], 
-    [216.63554612112824, -19.0450479334475, 9.609252176140112, -6.312170402591599, 3.146919073190075], 
-    [177.94711834639443, 110.39882919514417, -34.69680828555997, 13.575839801777828, -12.414595228016992]
+#piecewise polynomial fit of temperature to rgb conversion produced by util/get_rgb.py with -tolerance 1, each channel is
+#a list of segments (lower temperature, upper temperature, co-efficients in ascending order of degree) where the
+#polynomial is evaluated on the temperature mapped from [lower, upper] to [-1, 1]
+RGB_SEGMENTS = [
+    [
+        (0.0, 5705.0, [255.0]),
+        (5705.0, 8025.0, [237.60790245152808, -21.038374793447616, 5.721022588767062, 4.392489094642719, -5.4784719317104225]),
+        (8025.0, 10350.0, [210.70606609642442, -9.080937411360699, 1.512038810851525, -0.244396266423718, 0.03737959569989522]),
+        (10350.0, 15000.0, [192.66541086927452, -7.891204987180646, 1.841565117113036, -0.4337000681869192, 0.09475652061829078]),
+    ],
+    [
+        (0.0, 665.0, [0.0]),
+        (665.0, 700.0, [19.957539692310903, 16.568441235747677, -10.831860581286913, -0.9994835174097092, 6.183212503271406]),
+        (700.0, 740.0, [39.57857644563801, 7.779243678762148, -0.8494281900187814, 0.19229991845402497, -0.05001222327059558]),
+        (740.0, 820.0, [58.01805943559176, 10.111962112604001, -1.001204243270733, 0.20372032467282458, -0.04921200629609065]),
+        (820.0, 980.0, [82.38804474598206, 13.504254231596315, -1.3027704675030551, 0.23975233376316415, -0.05568279826063603]),
+        (980.0, 1295.0, [114.57450252965798, 17.582728863655074, -1.8522145963499403, 0.29889632693650525, -0.06390656834955077]),
+        (1295.0, 1925.0, [155.46913456142636, 21.45147087569327, -2.9208194932229716, 0.46359406471895165, -0.08894380163600633]),
+        (1925.0, 3185.0, [201.38057912170805, 21.827990144525742, -4.218075129039364, 0.7990620227542966, -0.15432708553086935]),
+        (3185.0, 5710.0, [242.22434921744713, 16.511422704787684, -4.613178168049134, 1.1791123552110805, -0.27326934449603424]),
+        (5710.0, 6145.0, [255.0]),
+        (6145.0, 15000.0, [216.63554612112696, -19.045047933447698, 9.609252176141023, -6.312170402591113, 3.1469190731889998]),
+    ],
+    [
+        (0.0, 1395.0, [0.0]),
+        (1395.0, 1985.0, [39.757143356142045, 27.954413432705252, -2.5838136611047737, 5.237784203868517, -4.576773959576793]),
+        (1985.0, 2580.0, [89.49839771178259, 22.241276135781767, -1.08131102968533, 0.06719839316851078, -0.01669986073122379]),
+        (2580.0, 3770.0, [147.5901123561524, 33.54176731691825, -3.124518201472334, 0.2063188740821763, -0.007895886806291039]),
+        (3770.0, 6150.0, [225.05445478778316, 39.59803140311719, -6.2959368821407775, -1.2377743777233445, -2.335023824533524]),
+        (6150.0, 15000.0, [255.0]),
+    ],
     ]
 
-def main():
-    #iterate through GaiaSource files and open them provided they are csv files
-    for gaia_file in os.listdir(file_directory):
-        if gaia_file.endswith('.csv'):
-            try:
-                with open(file_directory + '/' + gaia_file) as current_csv:
-                    
-                    #create las header then create las file using header
-                    header = laspy.LasHeader(version = "1.4", point_format = 2)
-                    galaxy_data = laspy.LasData(header)
-
-                    #create extra dimensions in las file for storing meta data
-                    galaxy_data.add_extra_dims([
-                    laspy.ExtraBytesParams(name="solution_id", type="uint64"),
-                    laspy.ExtraBytesParams(name="designation", type="uint64"),
-                    laspy.ExtraBytesParams(name="source_id", type="uint64"),
-                    ])
-
-                    #create arrays for temporary storage of data to be added to the las file
-                    x, y, z = [], [], []
-                    red, green, blue = [], [], []
-                    solution_id, designation, source_id= [], [], []
-                   
-                   #create csv reader with optional fieldname capabilites
-                   #more information on the fieldnames used in the GaiaSource files can be found here:
-                   #https://gea.esac.esa.int/archive/documentation/GDR3/Gaia_archive/chap_datamodel/
-                   #sec_dm_main_source_catalogue/ssec_dm_gaia_source.html
-                    current_csv_reader = csv.DictReader(current_csv)
-
-                    #iterate through each star in the current GaiaSource file
-                    for i, row in enumerate(current_csv_reader, start = 1):
-                        try:
-
-                            #calculate cartesian coordinates and rgb colorisation of star(row)
-                            x_value, y_value, z_value = calculate_cartesian(row)
-                            #red_value, green_value, blue_value = calculate_rgb(calculate_temperature(row))
-                            red_value, green_value, blue_value = retrieve_rgb(calculate_temperature(row))
-
-                            #store unique source indentifiers and designations of star(row)
-                            solution_id_value = int(row['solution_id'])
-                            designation_value = int(row['designation'][11:])
-                            source_id_value = int(row['source_id'])
-
-                            #add values to associated temporary array, performed separately in case calculations produce an 
-                            #exception
-                            x.append(x_value)
-                            y.append(y_value)
-                            z.append(z_value)
-                            red.append(red_value)
-                            green.append(green_value)
-                            blue.append(blue_value)
-                            solution_id.append(solution_id_value)
-                            designation.append(designation_value)
-                            source_id.append(source_id_value)
-                            
-                            #print to console if no exceptions occured for the star
-                            print("data in row " + str(i) + " successfully added")
-
-                        #print to console if an exception occured for the star
-                        except Exception as RowError:
-                            print("Exception occured in row " + str(i) + " in file " + gaia_file + ": ", RowError)
-                            traceback.print_exc()
-                            print("\n")
-                            #pass
-
-                #add temporary arrays to the las file
-                galaxy_data.x = x
-                galaxy_data.y = y
-                galaxy_data.z = z
-                galaxy_data.red = red
-                galaxy_data.green = green
-                galaxy_data.blue = blue
-                galaxy_data.solution_id = solution_id
-                galaxy_data.designation = designation
-                galaxy_data.source_id = source_id
-
-                #write las file to local storage
-                galaxy_data.write(gaia_file + '.las')
-
-                #print to console if no exceptions occured for the GaiaSource file 
-                print(gaia_file + " was successfully converted")
-
-            #print to console if an exception occured for the GaiaSource file
-            except Exception as FileError:
-                print(gaia_file + ": ", FileError)
-                traceback.print_exc()
-
-#calculate x, y, z coordinates of the star using parallax, galactic longitude and latitude
+#BP - RP colour and effective temperature in K of the mean dwarf colour sequence, approximately following Pecaut &
+#Mamajek (2013), used to estimate temperatures from bp_rp by linear interpolation, colours beyond the ends of the table
+#take the temperature at that end, util/fit_teff.py can refit it from teff_gspphot
+BP_RP_TEMPERATURES = [
+    (-0.32, 31500.0), (-0.22, 20000.0), (-0.15, 15000.0), (-0.07, 11500.0), (0.00, 9700.0), (0.10, 8800.0),
+    (0.22, 8100.0), (0.38, 7200.0), (0.50, 6750.0), (0.59, 6500.0), (0.70, 6150.0), (0.82, 5770.0), (0.90, 5570.0),
+    (0.98, 5270.0), (1.10, 4950.0), (1.25, 4650.0), (1.43, 4400.0), (1.60, 4100.0), (1.84, 3850.0), (2.05, 3680.0),
+    (2.25, 3550.0), (2.55, 3380.0), (2.85, 3200.0), (3.25, 3050.0), (3.65, 2850.0), (4.10, 2650.0), (4.60, 2400.0),
+    ]
+
+#temperature estimators, wien applies Wien's law to the effective wavenumber of each star as it is read, bp_rp looks up
+#the BP - RP colour in BP_RP_TEMPERATURES and gspphot uses teff_gspphot where it is present and bp_rp otherwise, the
+#photometric estimators and their colours are calculated for a whole batch at once
+TEMPERATURE_ESTIMATORS = ['wien', 'bp_rp', 'gspphot']
+
+#rgb values of retrieve_rgb at every 100 K as an array of shape (3, 151), built by retrieve_rgb_array
+RGB_TABLE = None
+
+#lists of values collected for each batch of stars
+BATCH_COLUMNS = ['x', 'y', 'z', 'red', 'green', 'blue', 'temperature', 'bp_rp', 'teff_gspphot', 'solution_id',
+                 'designation', 'source_id', 'magnitude', 'distance', 'distance_error']
+
+#optional per star attributes that can be stored in the las files
+ATTRIBUTE_NAMES = sorted(writers.ATTRIBUTES) + ['intensity']
+
+#64 bit mask and splitmix64 multipliers used to scramble source ids for deterministic preview sampling
+HASH_MASK = 0xFFFFFFFFFFFFFFFF
+HASH_MULTIPLIERS = [0xBF58476D1CE4E5B9, 0x94D049BB133111EB]
+
+#number of rows of the largest GaiaSource file converted to measure the memory used per row for --memory-budget
+MEMORY_SAMPLE_ROWS = 10000
+
+#commands of the command line interface, convert is used when no command is given
+COMMANDS = ['convert', 'merge', 'render']
+
+def main(argv = None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] not in COMMANDS:
+        argv = ['convert'] + argv
+
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest='command')
+
+    convert_parser = subparsers.add_parser('convert', help='Convert GaiaSource csv files to las files')
+    convert_parser.add_argument('--input', default=file_directory, help='Directory of GaiaSource csv files')
+    convert_parser.add_argument('--output', default='.', help='Directory to write las files and the shard manifest to')
+    convert_parser.add_argument('--scratch', default=None, help='Directory to write las files to while they are converted, they are moved to --output when complete. Default is --output')
+    convert_parser.add_argument('--shard', default='0/1', help='Convert shard i of N (counting from 0) of the GaiaSource files, files are assigned to shards by size so every node gets the same assignment')
+    convert_parser.add_argument('--preview', default=None, type=float, help='Fraction of stars to keep, chosen by hashing source_id so every run keeps the same stars')
+    convert_parser.add_argument('--min-parallax-over-error', default=None, type=float, help='Reject stars with parallax_over_error below this value')
+    convert_parser.add_argument('--max-magnitude', default=None, type=float, help='Reject stars fainter than this G magnitude (phot_g_mean_mag)')
+    convert_parser.add_argument('--max-distance', default=None, type=float, help='Reject stars further away than this distance in kpc')
+    convert_parser.add_argument('--attributes', default='', help='Comma separated per star attributes to store for filtering in viewers: ' + ', '.join(ATTRIBUTE_NAMES) + ' (G magnitude as las intensity)')
+    convert_parser.add_argument('--writer', default='lasdata', choices=sorted(writers.WRITERS), help='Build each las file in memory with laspy.LasData, or preallocate it and write batches straight into its memory-mapped point records')
+    convert_parser.add_argument('--batch-size', default=100000, type=int, help='Number of stars converted to numpy arrays and written at a time')
+    convert_parser.add_argument('--workers', default=1, type=int, help='Number of GaiaSource files converted at once in separate processes, 0 for one per cpu')
+    convert_parser.add_argument('--memory-budget', default=None, help='Memory the conversion may use, e.g. 8G, the batch size and number of workers are reduced from --batch-size and --workers to fit it from the memory measured per row and batches shrink when resident memory nears the limit')
+    convert_parser.add_argument('--tile-order', default=None, type=int, help='Write stars into one las file per HEALPix tile of this order (0 to 12) found from source_id, instead of one las file per GaiaSource file')
+    convert_parser.add_argument('--max-open-tiles', default=64, type=int, help='Number of tile files kept open at a time, the least recently written is closed and reopened when needed')
+    convert_parser.add_argument('--colour', default='table', choices=['table', 'polynomial'], help='Colour stars from the rgb table rounded to 100 K or the vectorized piecewise polynomial fit')
+    convert_parser.add_argument('--temperature', default='wien', choices=TEMPERATURE_ESTIMATORS, help="Estimate temperatures with Wien's law from nu_eff_used_in_astrometry or pseudocolour, from the bp_rp colour, or from teff_gspphot falling back to bp_rp")
+    convert_parser.add_argument('--render', default='', help='Comma separated quick-look images to render while converting: ' + ', '.join(render.PROJECTIONS) + ', each shard writes a png and a buffer that galaxy render --from-buffers merges')
+    convert_parser.add_argument('--render-size', default='2048x1024', help='Size of the rendered images as WIDTHxHEIGHT')
+    convert_parser.add_argument('--render-extent', default=20.0, type=float, help='Half width in kpc of the face-on image')
+
+    merge_parser = subparsers.add_parser('merge', help='Check that every shard is complete and combine the shard manifests')
+    merge_parser.add_argument('--output', default='.', help='Directory the shards were written to')
+    merge_parser.add_argument('--preview', action='store_true', help='Merge the shards of the preview build instead of the full build')
+
+    render_parser = subparsers.add_parser('render', help='Render a quick-look image of existing las files or of the buffers rendered by each shard')
+    render_parser.add_argument('--input', default='.', help='Directory of las files or shard render buffers')
+    render_parser.add_argument('--pattern', default=None, help='Pattern of the las files to render. Default is every las file of the full build, or of the preview build with --preview')
+    render_parser.add_argument('--from-buffers', action='store_true', help='Merge the render buffers written by convert --render instead of reading las files')
+    render_parser.add_argument('--preview', action='store_true', help='Render the preview build instead of the full build written to the same directory')
+    render_parser.add_argument('--projection', default='sky', choices=render.PROJECTIONS, help='Hammer-Aitoff map of the sky seen from the sun or face-on x/y view of the disk')
+    render_parser.add_argument('--size', default='2048x1024', help='Size of the image as WIDTHxHEIGHT')
+    render_parser.add_argument('--extent', default=20.0, type=float, help='Half width in kpc of the face-on image')
+    render_parser.add_argument('--batch-size', default=1000000, type=int, help='Number of points read from the las files at a time')
+    render_parser.add_argument('--output', default=None, help='Image file to write, .png or .fits for a cube of star counts and mean colours. Default is render-PROJECTION.png, or render-PROJECTION.preview.png with --preview, in --input')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'render':
+        try:
+            render_images(args)
+        except ValueError as RenderError:
+            render_parser.error(str(RenderError))
+        return
+
+    if args.command == 'merge':
+        suffix = manifest.PREVIEW_SUFFIX if args.preview else ''
+        problems = manifest.merge_manifests(args.output, suffix)
+        for problem in problems:
+            print(problem)
+        if problems:
+            sys.exit(1)
+        print("shards merged into " + os.path.join(args.output, manifest.MERGED_MANIFEST_NAME.format(suffix = suffix)))
+        return
+
+    if args.preview is not None and not 0 < args.preview <= 1:
+        convert_parser.error("--preview must be a fraction in the range (0, 1]")
+    args.attributes = [name for name in args.attributes.split(',') if name != '']
+    for name in args.attributes:
+        if name not in ATTRIBUTE_NAMES:
+            convert_parser.error("unknown attribute " + name + ", choose from " + ', '.join(ATTRIBUTE_NAMES))
+    if args.tile_order is not None and not 0 <= args.tile_order <= tiles.SOURCE_ID_HEALPIX_ORDER:
+        convert_parser.error("--tile-order must be in the range 0 to " + str(tiles.SOURCE_ID_HEALPIX_ORDER))
+    if args.max_open_tiles < 1:
+        convert_parser.error("--max-open-tiles must be at least 1")
+    if args.workers == 0:
+        args.workers = os.cpu_count() or 1
+    if args.workers < 1:
+        convert_parser.error("--workers must be at least 1, or 0 for one per cpu")
+    if args.workers > 1 and args.tile_order is not None:
+        convert_parser.error("--workers can not be used with --tile-order as the files of a shard share its tile files")
+    if args.batch_size < 1:
+        convert_parser.error("--batch-size must be at least 1")
+    if args.memory_budget is not None:
+        try:
+            args.memory_budget = memory.parse_size(args.memory_budget)
+        except ValueError as SizeError:
+            convert_parser.error(str(SizeError))
+    args.render = [projection for projection in args.render.split(',') if projection != '']
+    for projection in args.render:
+        if projection not in render.PROJECTIONS:
+            convert_parser.error("unknown projection " + projection + ", choose from " + ', '.join(render.PROJECTIONS))
+    try:
+        args.render_size = render.parse_size(args.render_size)
+    except ValueError as SizeError:
+        convert_parser.error(str(SizeError))
+    try:
+        shard = manifest.parse_shard(args.shard)
+    except ValueError as ShardError:
+        convert_parser.error(str(ShardError))
+
+    convert(args, shard)
+
+#convert the GaiaSource files assigned to one shard then write the manifest of the shard
+def convert(args, shard):
+    scratch = args.scratch if args.scratch is not None else args.output
+    os.makedirs(args.output, exist_ok = True)
+    os.makedirs(scratch, exist_ok = True)
+
+    #iterate through the GaiaSource csv files assigned to this shard
+    gaia_files = manifest.list_gaia_files(args.input)
+    assigned = manifest.assign_shards(gaia_files, shard[1])[shard[0]]
+    #preview builds are written next to full builds so their outputs have a suffix to not overwrite them
+    preview_suffix = manifest.PREVIEW_SUFFIX if args.preview is not None else ''
+
+    #tiles are shared by every file of the shard, each shard writes its own tile files so shards never write to the same
+    #file
+    tile_pool = None
+    if args.tile_order is not None:
+        suffix = ('-shard' + str(shard[0]) if shard[1] > 1 else '') + preview_suffix
+        tile_pool = tiles.TileWriterPool(scratch, args.tile_order, args.attributes, args.max_open_tiles, suffix,
+                                         header_settings(args))
+
+    #quick-look images are rendered from every batch written by the shard
+    render_buffers = new_render_buffers(args)
+
+    batch_size, workers, limit = args.batch_size, min(args.workers, max(len(assigned), 1)), None
+    if args.memory_budget is not None:
+        try:
+            batch_size, workers, limit = plan_memory(args, assigned, render_buffers, workers)
+        except ValueError as BudgetError:
+            print(BudgetError)
+            sys.exit(1)
+
+    #each worker converts a file with its own render buffers which are merged into those of the shard
+    files = {}
+    shrinks = 0
+    if workers > 1:
+        tasks = [(gaia_file, args, scratch, memory.MemoryGovernor(limit, batch_size)) for gaia_file in assigned]
+        with multiprocessing.Pool(workers) as pool:
+            for gaia_file, entry, file_render_buffers, file_shrinks in pool.imap(convert_file_worker, tasks):
+                files[gaia_file] = entry
+                shrinks += file_shrinks
+                for render_buffer, file_render_buffer in zip(render_buffers, file_render_buffers):
+                    render_buffer.merge(file_render_buffer)
+    else:
+        governor = memory.MemoryGovernor(limit, batch_size)
+        for gaia_file in assigned:
+            files[gaia_file] = convert_file(gaia_file, args, scratch, tile_pool, render_buffers, governor)
+        shrinks = governor.shrinks
+    if shrinks:
+        print("batches were shrunk " + str(shrinks) + " times to stay within the memory budget")
+
+    for render_buffer in render_buffers:
+        name = render.BUFFER_NAME.format(projection = render_buffer.projection, index = shard[0], count = shard[1],
+                                         suffix = preview_suffix)
+        render_buffer.save(os.path.join(args.output, name))
+        render_buffer.write_image(os.path.join(args.output, name[:-len('.npz')] + '.png'))
+
+    #tile files are only complete once every file of the shard is converted
+    tile_index = None
+    if tile_pool is not None:
+        tile_index = tile_pool.close()
+        for tile_file in tile_index:
+            shutil.move(os.path.join(scratch, tile_file), os.path.join(args.output, tile_file))
+
+    #settings that change the contents of the output, shards converted with different settings can not be merged
+    settings = {'preview': args.preview, 'min_parallax_over_error': args.min_parallax_over_error,
+                'max_magnitude': args.max_magnitude, 'max_distance': args.max_distance, 'colour': args.colour,
+                'attributes': args.attributes, 'tile_order': args.tile_order, 'temperature': args.temperature}
+    #the statistics of every file are combined into those of the shard to keep the manifest small
+    statistics = stats.combine_statistics([entry.pop('statistics') for entry in files.values() if 'statistics' in entry])
+    manifest.write_shard_manifest(args.output, shard, gaia_files, assigned, settings, files, tile_index, statistics,
+                                  preview_suffix)
+
+#convert one GaiaSource file into a las file written to the scratch directory then moved to the output directory, or into
+#the tiles of a tile pool, returns the manifest entry of the file with its row and point counts, rejected rows per
+#reason, bounds and either its las file or the number of points written to each tile file
+def convert_file(gaia_file, args, scratch, tile_pool = None, render_buffers = (), governor = None):
+    #preview builds are written next to full builds so they must not overwrite them
+    output_file = gaia_file + (manifest.PREVIEW_SUFFIX if args.preview is not None else '') + '.las'
+    rejected = collections.Counter()
+    statistics = stats.BatchStatistics()
+
+    try:
+        #the number of rows is an upper bound of the number of points for writers that preallocate the las file, it is
+        #only counted for those writers as it takes an extra read of the file
+        if tile_pool is not None:
+            writer = tiles.TileFileWriter(tile_pool)
+        else:
+            writer_class = writers.WRITERS[args.writer]
+            point_count_bound = count_rows(os.path.join(args.input, gaia_file)) if writer_class.preallocates else 0
+            writer = writer_class(os.path.join(scratch, output_file), point_count_bound, args.attributes,
+                                  header_settings(args))
+
+        with open(os.path.join(args.input, gaia_file), newline = '') as current_csv:
+
+            #create arrays for temporary storage of a batch of data to be added to the las file
+            batch = new_batch()
+            batch_size = args.batch_size if governor is None else governor.batch_size
+
+           #create csv reader which only decodes rows that pass the preview sample and quality cuts
+           #more information on the fieldnames used in the GaiaSource files can be found here:
+           #https://gea.esac.esa.int/archive/documentation/GDR3/Gaia_archive/chap_datamodel/
+           #sec_dm_main_source_catalogue/ssec_dm_gaia_source.html
+            current_csv_reader = filtered_rows(current_csv, args, rejected)
+
+            #iterate through each star in the current GaiaSource file
+            for i, row in current_csv_reader:
+                try:
+
+                    #calculate cartesian coordinates and rgb colorisation of star(row) and add it to the batch
+                    add_row(batch, row, args)
+
+                    #print to console if no exceptions occured for the star
+                    print("data in row " + str(i) + " successfully added")
+
+                #print to console if an exception occured for the star
+                except Exception as RowError:
+                    rejected[str(RowError)] += 1
+                    print("Exception occured in row " + str(i) + " in file " + gaia_file + ": ", RowError)
+                    traceback.print_exc()
+                    print("\n")
+                    #pass
+
+                #write full batches to the las file so only one batch of rows is held in python lists
+                if len(batch['x']) >= batch_size:
+                    write_batch(writer, batch_columns(batch, args), render_buffers, statistics)
+                    batch = new_batch()
+                    #writers that keep every batch until they are closed use as much memory whatever the batch size
+                    if governor is not None and not writer.keeps_batches:
+                        batch_size = governor.check()
+
+        #write the last batch then las file to scratch storage and move it to the output directory once it is complete
+        write_batch(writer, batch_columns(batch, args), render_buffers, statistics)
+        point_count, bounds = writer.close()
+        if tile_pool is None:
+            shutil.move(os.path.join(scratch, output_file), os.path.join(args.output, output_file))
+
+        #print to console if no exceptions occured for the GaiaSource file
+        print(gaia_file + " was successfully converted")
+
+    #print to console if an exception occured for the GaiaSource file
+    except Exception as FileError:
+        print(gaia_file + ": ", FileError)
+        traceback.print_exc()
+        #remove the partly written las file so it is not mistaken for a complete one
+        if tile_pool is None and os.path.exists(os.path.join(scratch, output_file)):
+            os.remove(os.path.join(scratch, output_file))
+        return {'error': str(FileError)}
+
+    entry = {'rows': point_count + sum(rejected.values()), 'points': point_count, 'rejected': dict(rejected),
+             'bounds': bounds, 'statistics': statistics.to_dict()}
+    if tile_pool is not None:
+        entry['tiles'] = dict(sorted(writer.tiles.items()))
+    else:
+        entry['output'] = output_file
+
+    return entry
+
+#convert a file in a worker process with new render buffers, returns the file with its manifest entry, render buffers
+#and the number of times its batches were shrunk
+def convert_file_worker(task):
+    gaia_file, args, scratch, governor = task
+    render_buffers = new_render_buffers(args)
+    entry = convert_file(gaia_file, args, scratch, None, render_buffers, governor)
+
+    return gaia_file, entry, render_buffers, governor.shrinks
+
+#create empty buffers for the images rendered while converting
+def new_render_buffers(args):
+    return [render.RenderBuffer(projection, *args.render_size, extent = args.render_extent) for projection in args.render]
+
+#choose the batch size and number of workers that fit the memory budget from the memory used per row while converting a
+#sample of the largest assigned file, the memory of the main process and the memory each worker holds whatever the batch
+#size, the chosen settings are printed, returns (batch_size, workers, limit) where limit is the memory of each process
+#converting files
+def plan_memory(args, assigned, render_buffers, workers):
+    base_bytes = memory.rss_bytes() or 0
+    row_bytes, kept_bytes = 0, 0
+    largest_rows = 0
+    if assigned:
+        largest = max(assigned, key = lambda gaia_file: os.path.getsize(os.path.join(args.input, gaia_file)))
+        row_bytes, kept_bytes = measure_row_bytes(os.path.join(args.input, largest), args)
+        largest_rows = count_rows(os.path.join(args.input, largest))
+
+    #each worker holds its own render buffers, and the main process holds the merged buffers and those it receives, the
+    #lasdata writer also keeps every batch of a file and copies them into point records when the file is written
+    render_bytes = sum(render_buffer.counts.nbytes + render_buffer.colour_sums.nbytes for render_buffer in render_buffers)
+    fixed_bytes = render_bytes
+    if args.writer == 'lasdata' and args.tile_order is None:
+        fixed_bytes += 2 * kept_bytes * largest_rows
+    base_bytes += render_bytes if workers == 1 else 2 * render_bytes
+
+    try:
+        batch_size, workers, limit = memory.plan(args.memory_budget, base_bytes, fixed_bytes, row_bytes, args.batch_size, workers)
+    except ValueError as BudgetError:
+        if args.writer == 'lasdata':
+            raise ValueError(str(BudgetError) + ", --writer memmap holds only one batch of each file in memory")
+        raise
+
+    print("memory budget " + memory.format_size(args.memory_budget) + ": " + format(row_bytes, '.0f') + " bytes per row, "
+          + memory.format_size(base_bytes) + " base, " + memory.format_size(fixed_bytes) + " per worker besides batches, "
+          + "batch size " + str(batch_size) + ", " + str(workers) + " workers, " + memory.format_size(limit) + " per process")
+
+    return batch_size, workers, limit
+
+#measure the peak bytes allocated per row while a sample of rows of a GaiaSource file is decoded, batched, converted to
+#numpy arrays and scaled into las point records, along with the bytes per row of the arrays and records that a writer
+#keeps for a whole file
+def measure_row_bytes(path, args):
+    def convert_sample():
+        batch = new_batch()
+        with open(path, newline = '') as csv_file:
+            for i, row in itertools.islice(filtered_rows(csv_file, args), MEMORY_SAMPLE_ROWS):
+                try:
+                    add_row(batch, row, args)
+                except Exception:
+                    pass
+        columns = batch_columns(batch, args)
+        header = writers.create_header(args.attributes)
+        points = laspy.ScaleAwarePointRecord.zeros(len(columns['x']), header = header)
+        writers.fill_records(points.array, header, columns, args.attributes)
+
+        #the batch is returned so it is still allocated when the peak is read
+        return batch, columns, points
+
+    (batch, columns, points), peak = memory.traced_peak(convert_sample)
+    rows = max(len(columns['x']), 1)
+
+    return peak / rows, (sum(values.nbytes for values in columns.values()) + points.array.nbytes) / rows
+
+#write a batch of stars given as numpy arrays and add it to the images being rendered and the statistics of the file
+def write_batch(writer, columns, render_buffers, statistics):
+    writer.write(columns)
+    for render_buffer in render_buffers:
+        render_buffer.add(columns)
+    statistics.add(columns)
+
+#render an image of the las files in a directory, or merge the render buffers written by each shard, and write it
+def render_images(args):
+    if args.from_buffers:
+        render_buffer = render.merge_buffers(args.input, args.projection, manifest.PREVIEW_SUFFIX if args.preview else '')
+        if render_buffer is None:
+            raise ValueError("no " + args.projection + (" preview" if args.preview else "") + " render buffers found in " + args.input)
+    else:
+        #*.las also matches the las files of a preview build written to the same directory
+        preview_pattern = '*' + manifest.PREVIEW_SUFFIX + '.las'
+        pattern, exclude = args.pattern, None
+        if pattern is None:
+            pattern, exclude = (preview_pattern, None) if args.preview else ('*.las', preview_pattern)
+        render_buffer = render.RenderBuffer(args.projection, *render.parse_size(args.size), extent = args.extent)
+        if not render.render_las_files(render_buffer, args.input, pattern, args.batch_size, exclude):
+            raise ValueError("no las files matching " + pattern + " found in " + args.input)
+
+    output = args.output
+    if output is None:
+        output = os.path.join(args.input, 'render-' + args.projection + (manifest.PREVIEW_SUFFIX if args.preview else '') + '.png')
+    render_buffer.write_image(output)
+    print(str(render_buffer.counts.sum()) + " stars rendered to " + output)
+
+#settings recorded in the header of every las file so readers know how temperatures and colours were calculated
+def header_settings(args):
+    return {'temperature': args.temperature, 'colour': args.colour}
+
+#calculate the values of a star(row) and add them to a batch, the row is left out of the batch if any calculation
+#raises an exception
+def add_row(batch, row, args):
+    #calculate cartesian coordinates and rgb colorisation of star(row)
+    x_value, y_value, z_value = calculate_cartesian(row)
+    #the polynomial colours and photometric temperatures are calculated for the whole batch at once when it is written
+    if args.temperature != 'wien':
+        bp_rp_value, teff_gspphot_value = read_photometry(row, args.temperature)
+    else:
+        temperature_value = calculate_temperature(row)
+        if args.colour == 'polynomial':
+            check_temperature(temperature_value)
+        else:
+            red_value, green_value, blue_value = retrieve_rgb(temperature_value)
+
+    #store unique source indentifiers and designations of star(row)
+    solution_id_value = int(row['solution_id'])
+    designation_value = int(row['designation'][11:])
+    source_id_value = int(row['source_id'])
+    attribute_values = calculate_attributes(row, args.attributes)
+
+    #add values to associated temporary array, performed separately in case calculations produce an
+    #exception
+    batch['x'].append(x_value)
+    batch['y'].append(y_value)
+    batch['z'].append(z_value)
+    if args.temperature != 'wien':
+        batch['bp_rp'].append(bp_rp_value)
+        batch['teff_gspphot'].append(teff_gspphot_value)
+    else:
+        batch['temperature'].append(temperature_value)
+        if args.colour != 'polynomial':
+            batch['red'].append(red_value)
+            batch['green'].append(green_value)
+            batch['blue'].append(blue_value)
+    batch['solution_id'].append(solution_id_value)
+    batch['designation'].append(designation_value)
+    batch['source_id'].append(source_id_value)
+    for name, attribute_value in attribute_values.items():
+        batch[name].append(attribute_value)
+
+#create empty lists for a batch of stars
+def new_batch():
+    return {name: [] for name in BATCH_COLUMNS}
+
+#convert a batch of stars to numpy arrays for the las writer, colours are calculated for the whole batch at once with
+#the polynomial colour mode, and temperatures and colours are with the photometric temperature estimators
+def batch_columns(batch, args):
+    columns = {
+        'x': np.array(batch['x'], dtype = np.float64),
+        'y': np.array(batch['y'], dtype = np.float64),
+        'z': np.array(batch['z'], dtype = np.float64),
+        }
+    if args.temperature != 'wien':
+        temperature = calculate_temperature_array(np.array(batch['bp_rp'], dtype = np.float64),
+                                                  np.array(batch['teff_gspphot'], dtype = np.float64))
+        #stars hotter than the colour table take its hottest colour
+        colour_temperature = np.minimum(temperature, 15000)
+        if args.colour == 'polynomial':
+            columns['red'], columns['green'], columns['blue'] = calculate_rgb_array(colour_temperature)
+        else:
+            columns['red'], columns['green'], columns['blue'] = retrieve_rgb_array(colour_temperature)
+    else:
+        temperature = np.array(batch['temperature'], dtype = np.float64)
+        if args.colour == 'polynomial':
+            columns['red'], columns['green'], columns['blue'] = calculate_rgb_array(temperature)
+        else:
+            for name in ['red', 'green', 'blue']:
+                columns[name] = np.array(batch[name], dtype = np.float64)
+    #temperatures are kept for the statistics even when they are not stored
+    columns['temperature'] = temperature
+    for name, type in writers.EXTRA_DIMENSIONS:
+        columns[name] = np.array(batch[name], dtype = type)
+    for name in args.attributes:
+        #intensity is scaled from the G magnitude
+        if name != 'temperature':
+            columns[name] = np.array(batch['magnitude' if name == 'intensity' else name], dtype = np.float64)
+
+    return columns
+
+#count the rows of a csv file without decoding them, reading in large blocks
+def count_rows(path):
+    line_count = 0
+    last_byte = b'\n'
+    with open(path, 'rb') as csv_file:
+        for block in iter(lambda: csv_file.read(1 << 24), b''):
+            line_count += block.count(b'\n')
+            last_byte = block[-1:]
+
+    #count a last row that does not end with a newline but do not count the header
+    return max(line_count + (last_byte != b'\n') - 1, 0)
+
+#yield the line number and fieldname dictionary of each row in a GaiaSource file that survives the preview sample and
+#quality cuts, the sample only needs the source_id prefix of the raw line and the cuts only split the line up to the
+#last field they test so rejected rows are never decoded as csv
+def filtered_rows(csv_file, args, rejected = None):
+    rejected = rejected if rejected is not None else collections.Counter()
+    fieldnames = next(csv.reader(csv_file))
+    source_id_index = fieldnames.index('source_id')
+    row_filters = build_row_filters(fieldnames, args)
+    last_index = max([index for reason, index, row_filter in row_filters], default = -1)
+
+    if args.preview is not None:
+        threshold = int(args.preview * (HASH_MASK + 1))
+
+    for i, line in enumerate(csv_file, start = 1):
+        if args.preview is not None:
+            source_id_value = int(line.split(',', source_id_index + 1)[source_id_index].strip('"'))
+            if scramble_source_id(source_id_value) >= threshold:
+                rejected['preview'] += 1
+                continue
+
+        #a quoted field may hold commas so a line is decoded as csv before it is tested if a field up to the last tested
+        #one opens a quote that it does not close, quotes after those fields do not matter
+        if row_filters:
+            fields = line.split(',', last_index + 1)
+            if any(field.startswith('"') and field.count('"') % 2 for field in fields[:last_index + 1]):
+                fields = next(csv.reader([line]))
+            reason = next((reason for reason, index, row_filter in row_filters if not row_filter(fields)), None)
+            if reason is not None:
+                rejected[reason] += 1
+                continue
+
+        yield i, dict(zip(fieldnames, next(csv.reader([line]))))
+
+#build a list of (reason, index, test) triples for the quality cuts requested on the command line, each test only converts
+#the one field at its index and rejects rows where that field is empty
+def build_row_filters(fieldnames, args):
+    row_filters = []
+    if args.min_parallax_over_error is not None:
+        index = fieldnames.index('parallax_over_error')
+        row_filters.append(('parallax_over_error', index, field_filter(index, lambda value: value >= args.min_parallax_over_error)))
+    if args.max_magnitude is not None:
+        index = fieldnames.index('phot_g_mean_mag')
+        row_filters.append(('magnitude', index, field_filter(index, lambda value: value <= args.max_magnitude)))
+    if args.max_distance is not None:
+        #parallax is in mas so the distance in kpc is its reciprocal
+        index = fieldnames.index('parallax')
+        row_filters.append(('distance', index, field_filter(index, lambda value: value * args.max_distance >= 1)))
+
+    return row_filters
+
+#test of the field at an index of a list of fields, fields are stripped of whitespace such as the newline of the last
+#field of a line and of the quotes of a quoted field that was split without csv decoding when they are converted
+def field_filter(index, test):
+    def row_filter(fields):
+        try:
+            return test(float(fields[index].strip().strip('"')))
+        except ValueError:
+            return False
+
+    return row_filter
+
+#scramble a source id with the splitmix64 finaliser so that the low bits are uniformly distributed even though the high
+#bits of a source id encode the position of the star on the sky
+def scramble_source_id(source_id):
+    source_id = ((source_id ^ (source_id >> 30)) * HASH_MULTIPLIERS[0]) & HASH_MASK
+    source_id = ((source_id ^ (source_id >> 27)) * HASH_MULTIPLIERS[1]) & HASH_MASK
+    return source_id ^ (source_id >> 31)
+
+#calculate x, y, z coordinates of the star using parallax, galactic longitude and latitude, l and b are given in degrees
+#in the GaiaSource files
 #more information on the formulas can be found here:
 #https://en.wikipedia.org/wiki/Galactic_coordinate_system
 def calculate_cartesian(row):
     if row['parallax'] == '':
         raise Exception("no parallax")
     else:
-        x_value = math.cos(float(row['b'])) * math.cos(float(row['l'])) / float(row['parallax'])
-        y_value = math.cos(float(row['b'])) * math.sin(float(row['l'])) / float(row['parallax'])
-        z_value = math.sin(float(row['b'])) / float(row['parallax'])
+        l_value = math.radians(float(row['l']))
+        b_value = math.radians(float(row['b']))
+        x_value = math.cos(b_value) * math.cos(l_value) / float(row['parallax'])
+        y_value = math.cos(b_value) * math.sin(l_value) / float(row['parallax'])
+        z_value = math.sin(b_value) / float(row['parallax'])
+    #coordinates that do not fit the scaled integers of the las files are rejected instead of wrapping around
+    if max(abs(x_value), abs(y_value), abs(z_value)) > writers.COORDINATE_LIMIT:
+        raise Exception("coordinates beyond the range of the las files")
     
     return x_value, y_value, z_value
 
@@ -138,58 +654,84 @@ def calculate_temperature(row):
 
     return temperature
 
+#read the photometry a photometric temperature estimator needs from a star(row), bp_rp is required unless the gspphot
+#estimator has a teff_gspphot, missing values are nan
+def read_photometry(row, estimator):
+    bp_rp_value = optional_float(row['bp_rp'])
+    teff_gspphot_value = optional_float(row['teff_gspphot']) if estimator == 'gspphot' else math.nan
+    if math.isnan(bp_rp_value) and math.isnan(teff_gspphot_value):
+        raise Exception("no bp_rp" if estimator == 'bp_rp' else "no teff_gspphot or bp_rp")
+
+    return bp_rp_value, teff_gspphot_value
+
+#estimate temperatures for arrays of bp_rp colours and teff_gspphot temperatures by interpolating BP_RP_TEMPERATURES,
+#teff_gspphot is used where it is not nan
+def calculate_temperature_array(bp_rp, teff_gspphot):
+    colours, temperatures = zip(*BP_RP_TEMPERATURES)
+    temperature = np.interp(bp_rp, colours, temperatures)
+
+    return np.where(np.isnan(teff_gspphot), temperature, teff_gspphot)
+
+#calculate the optional attributes of the star that are not calculated anyway, empty fields give nan so the star is still
+#added and the attribute is marked as missing, parallax is known to be present once the cartesian coordinates are calculated
+#but a distance is only given for a positive parallax
+def calculate_attributes(row, attributes):
+    attribute_values = {}
+    if 'magnitude' in attributes or 'intensity' in attributes:
+        attribute_values['magnitude'] = optional_float(row['phot_g_mean_mag'])
+    if 'distance' in attributes:
+        parallax = float(row['parallax'])
+        attribute_values['distance'] = 1 / parallax if parallax > 0 else math.nan
+    if 'distance_error' in attributes:
+        attribute_values['distance_error'] = abs(optional_float(row['parallax_error']) / float(row['parallax']))
+
+    return attribute_values
+
+def optional_float(value):
+    return float(value) if value != '' else math.nan
+
 #calculate rgb values of star using temperature
 #https://en.wikipedia.org/wiki/CIE_1931_color_space
 def calculate_rgb(t):
-    if 0 <= t <= 15000:
-
-        #calculate red value
-        if t <= 5705:
-            red_value = 255
-        elif 5705 < t:
-            red_value = calculate_polynomial(t, POLYNOMIAL_COEFFICIENTS[0])
-
-        #calcluate green value
-        if t <= 665:
-            green_value = 0
-        elif 665 < t <= 5705:
-            green_value = calculate_polynomial(t, POLYNOMIAL_COEFFICIENTS[1])
-        elif 5705 < t <= 6145:
-            green_value = 255
-        elif 6145 < t:
-            green_value = calculate_polynomial(t, POLYNOMIAL_COEFFICIENTS[2])
-
-        #calculate blue value
-        if t <= 1395:
-            blue_value = 0
-        elif 1395 < t <= 6145:
-            blue_value = calculate_polynomial(t, POLYNOMIAL_COEFFICIENTS[3])
-        elif 6145 < t:
-            blue_value = 255
-
-        print(t, red_value, green_value, blue_value)
-    else:
-        raise Exception("temperature outside of normal range: " + str(t))
+    check_temperature(t)
 
-    rgb_value = [red_value, green_value, blue_value]
+    return calculate_rgb_array(np.array([t]))[:, 0].tolist()
 
-    #normalise rgb value
-    for value in rgb_value:
-        if value > 255:
-            value = 255
-        if value < 0:
-            value = 0
-    
-    return rgb_value
+#raise an exception for temperatures outside of the range covered by RGB_SEGMENTS
+def check_temperature(t):
+    if not 0 <= t <= 15000:
+        raise Exception("temperature outside of normal range: " + str(t))
 
-#calculate a polynomial using variable t where the polynomiasl coefficents are represented by coeffcients in ascending order
-def calculate_polynomial(t, coefficients):
-    colour_value = 0
-    for i, coefficient in enumerate(coefficients):
-        colour_value += coefficient * t ** i
+#calculate rgb values for an array of temperatures, every segment polynomial is evaluated over the whole array and
+#np.select picks the segment each temperature falls in, then values are clipped to the range 0 to 255
+def calculate_rgb_array(t):
+    rgb_value = np.empty((3, len(t)))
+    for channel, segments in enumerate(RGB_SEGMENTS):
+        conditions = [t <= upper for lower, upper, coefficients in segments]
+        choices = [calculate_polynomial(t, coefficients, lower, upper) for lower, upper, coefficients in segments]
+        rgb_value[channel] = np.select(conditions, choices, default = choices[-1])
+
+    return np.clip(rgb_value, 0, 255)
+
+#calculate a polynomial with Horner's method using variable t mapped from [lower, upper] to [-1, 1] where the polynomial
+#coefficents are represented by coeffcients in ascending order
+def calculate_polynomial(t, coefficients, lower, upper):
+    x = (2 * t - (lower + upper)) / (upper - lower)
+    colour_value = np.full_like(x, coefficients[-1])
+    for coefficient in reversed(coefficients[:-1]):
+        colour_value = colour_value * x + coefficient
 
     return colour_value
 
+#retrieve rgb values for an array of temperatures in the range 0 to 15000 from the same table as retrieve_rgb, the table is
+#built on first use, np.round rounds halves to even like round does
+def retrieve_rgb_array(t):
+    global RGB_TABLE
+    if RGB_TABLE is None:
+        RGB_TABLE = np.array([retrieve_rgb(table_t) for table_t in range(0, 15100, 100)]).T
+
+    return RGB_TABLE[:, np.round(t / 100).astype(np.int64)]
+
 #retrive rgb values of star using temperature
 #https://en.wikipedia.org/wiki/CIE_1931_color_space
 def retrieve_rgb(t):
@@ -0,0 +1,174 @@
+import glob
+import hashlib
+import json
+import os
+import re
+import stats
+
+#name of the manifest written by each shard and of the manifest written by the merge step, the suffix keeps the manifests
+#of preview builds from replacing those of full builds written to the same directory
+SHARD_MANIFEST_NAME = 'manifest-{index}-of-{count}{suffix}.json'
+MERGED_MANIFEST_NAME = 'manifest{suffix}.json'
+
+#suffix of the outputs of preview builds
+PREVIEW_SUFFIX = '.preview'
+
+#list the GaiaSource csv files in a directory as (name, size in bytes) pairs sorted by name
+def list_gaia_files(directory):
+    gaia_files = []
+    for gaia_file in sorted(os.listdir(directory)):
+        if gaia_file.endswith('.csv'):
+            gaia_files.append((gaia_file, os.path.getsize(os.path.join(directory, gaia_file))))
+
+    return gaia_files
+
+#parse a shard given on the command line as "i/N" where i counts from 0 up to N - 1
+def parse_shard(shard):
+    try:
+        index, count = (int(value) for value in shard.split('/'))
+    except ValueError:
+        raise ValueError("shard must be given as i/N, e.g. 0/4: " + shard)
+    if not 0 <= index < count:
+        raise ValueError("shard index must be in the range 0 to N - 1: " + shard)
+
+    return index, count
+
+#assign files to shards so every node computes the same assignment from the same directory listing, the largest files
+#are placed first, each on the shard with the fewest bytes so far, ties are broken by file name and shard index, returns
+#the sorted file names of each shard
+def assign_shards(gaia_files, count):
+    shards = [[] for _ in range(count)]
+    shard_bytes = [0] * count
+    for gaia_file, size in sorted(gaia_files, key = lambda gaia_file: (-gaia_file[1], gaia_file[0])):
+        smallest = min(range(count), key = lambda index: (shard_bytes[index], index))
+        shards[smallest].append(gaia_file)
+        shard_bytes[smallest] += size
+
+    return [sorted(shard) for shard in shards]
+
+#digest of the input listing, shards can only be merged if they were assigned from the same listing
+def digest_inputs(gaia_files):
+    listing = ''.join(gaia_file + ':' + str(size) + '\n' for gaia_file, size in sorted(gaia_files))
+
+    return hashlib.sha1(listing.encode()).hexdigest()
+
+#write the manifest of one shard, files maps each assigned GaiaSource file to the entry returned by its conversion,
+#tiles is the index of tile files written by the shard when the output is tiled and statistics are the mergeable
+#statistics of the stars written by the shard, the suffix is PREVIEW_SUFFIX for preview builds
+def write_shard_manifest(directory, shard, gaia_files, assigned, settings, files, tiles = None, statistics = None,
+                         suffix = ''):
+    index, count = shard
+    shard_manifest = {
+        'shard': [index, count],
+        'inputs': {'count': len(gaia_files), 'bytes': sum(size for gaia_file, size in gaia_files),
+                   'digest': digest_inputs(gaia_files)},
+        'settings': settings,
+        'assigned': assigned,
+        'files': files,
+        }
+    if tiles is not None:
+        shard_manifest['tiles'] = tiles
+    if statistics is not None:
+        shard_manifest['statistics'] = statistics
+    path = os.path.join(directory, SHARD_MANIFEST_NAME.format(index = index, count = count, suffix = suffix))
+    with open(path + '.tmp', 'w') as manifest_file:
+        json.dump(shard_manifest, manifest_file, indent = 1)
+    os.replace(path + '.tmp', path)
+
+    return path
+
+#combine the entries of several converted files into totals of rows, points, rejected rows per reason and bounds
+def combine_entries(entries):
+    totals = {'rows': 0, 'points': 0, 'rejected': {}, 'bounds': None}
+    for entry in entries:
+        totals['rows'] += entry['rows']
+        totals['points'] += entry['points']
+        for reason, rejected in entry['rejected'].items():
+            totals['rejected'][reason] = totals['rejected'].get(reason, 0) + rejected
+        if entry['bounds'] is not None:
+            if totals['bounds'] is None:
+                totals['bounds'] = [list(entry['bounds'][0]), list(entry['bounds'][1])]
+            else:
+                totals['bounds'] = [[min(a, b) for a, b in zip(totals['bounds'][0], entry['bounds'][0])],
+                                    [max(a, b) for a, b in zip(totals['bounds'][1], entry['bounds'][1])]]
+
+    return totals
+
+#check that the shard manifests in a directory cover every input file exactly once with no failed conversions, then
+#write a merged manifest with the combined totals and statistics and an index of every output file, returns the list of
+#problems found, the merged manifest is only written if there are none, only the shards of a full build or of a preview
+#build when the suffix is PREVIEW_SUFFIX are merged
+def merge_manifests(directory, suffix = ''):
+    #the glob of the full build also matches the manifests of the preview build, so names are matched exactly
+    name = SHARD_MANIFEST_NAME.format(index = '*', count = '*', suffix = suffix)
+    name_pattern = re.compile(re.escape(name).replace(r'\*', r'\d+') + '$')
+    shard_manifests = []
+    for path in sorted(glob.glob(os.path.join(directory, name))):
+        if name_pattern.match(os.path.basename(path)) is None:
+            continue
+        with open(path) as manifest_file:
+            shard_manifests.append(json.load(manifest_file))
+
+    if not shard_manifests:
+        return ["no shard manifests found in " + directory]
+
+    problems = []
+    first = shard_manifests[0]
+    count = first['shard'][1]
+    for shard_manifest in shard_manifests:
+        name = 'shard ' + str(shard_manifest['shard'][0]) + '/' + str(shard_manifest['shard'][1])
+        if shard_manifest['shard'][1] != count:
+            problems.append(name + " belongs to a build with a different number of shards")
+        if shard_manifest['inputs']['digest'] != first['inputs']['digest']:
+            problems.append(name + " was assigned from a different input listing")
+        if shard_manifest['settings'] != first['settings']:
+            problems.append(name + " was converted with different settings")
+
+    indexes = [shard_manifest['shard'][0] for shard_manifest in shard_manifests if shard_manifest['shard'][1] == count]
+    for index in range(count):
+        if index not in indexes:
+            problems.append("shard " + str(index) + "/" + str(count) + " has no manifest")
+
+    files = {}
+    for shard_manifest in shard_manifests:
+        for gaia_file in shard_manifest['assigned']:
+            entry = shard_manifest['files'].get(gaia_file)
+            if gaia_file in files:
+                problems.append(gaia_file + " was assigned to more than one shard")
+            elif entry is None:
+                problems.append(gaia_file + " was not converted")
+            elif 'error' in entry:
+                problems.append(gaia_file + " failed: " + entry['error'])
+            else:
+                outputs = list(entry['tiles']) if 'tiles' in entry else [entry['output']]
+                missing = [output for output in outputs if not os.path.exists(os.path.join(directory, output))]
+                for output in missing:
+                    problems.append(gaia_file + " output " + output + " is missing")
+                if not missing:
+                    files[gaia_file] = entry
+
+    if len(files) != first['inputs']['count'] and not problems:
+        problems.append(str(first['inputs']['count'] - len(files)) + " input files are not covered by any shard")
+
+    if problems:
+        return problems
+
+    merged_manifest = {
+        'shards': count,
+        'inputs': first['inputs'],
+        'settings': first['settings'],
+        'totals': combine_entries(files.values()),
+        'files': dict(sorted(files.items())),
+        }
+    statistics = stats.combine_statistics([shard_manifest['statistics'] for shard_manifest in shard_manifests
+                                           if 'statistics' in shard_manifest])
+    if statistics is not None:
+        merged_manifest['statistics'] = statistics
+    #tile files are written per shard so a tile may have a file from each shard that wrote stars into it
+    if 'tiles' in first:
+        merged_manifest['tiles'] = dict(sorted((tile_file, tile) for shard_manifest in shard_manifests
+                                               for tile_file, tile in shard_manifest['tiles'].items()))
+    with open(os.path.join(directory, MERGED_MANIFEST_NAME.format(suffix = suffix)), 'w') as manifest_file:
+        json.dump(merged_manifest, manifest_file, indent = 1)
+
+    return []
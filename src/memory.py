@@ -0,0 +1,98 @@
+import os
+import tracemalloc
+
+#units of memory sizes given on the command line
+SIZE_UNITS = {'': 1, 'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30, 'T': 1 << 40}
+
+#smallest batch the planner will choose or the governor will shrink to, smaller batches spend most of their time in
+#numpy call overhead
+MINIMUM_BATCH_SIZE = 1000
+
+#fraction of a process's memory limit at which the governor starts halving the batch size, and below which it doubles
+#the batch size again up to the planned size, the gap keeps it from shrinking and growing on alternate batches
+SHRINK_FRACTION = 0.9
+GROW_FRACTION = 0.7
+
+#parse a memory size given on the command line as a number of bytes with an optional K, M, G or T suffix, e.g. 4G
+def parse_size(size):
+    number, unit = size.strip().upper().rstrip('B'), ''
+    if number and number[-1] in SIZE_UNITS:
+        number, unit = number[:-1], number[-1]
+    try:
+        size_bytes = int(float(number) * SIZE_UNITS[unit])
+    except ValueError:
+        raise ValueError("memory size must be a number of bytes with an optional K, M, G or T suffix, e.g. 4G: " + size)
+    if size_bytes <= 0:
+        raise ValueError("memory size must be positive: " + size)
+
+    return size_bytes
+
+#format a number of bytes for reports
+def format_size(size_bytes):
+    for unit in ['T', 'G', 'M', 'K']:
+        if size_bytes >= SIZE_UNITS[unit]:
+            return format(size_bytes / SIZE_UNITS[unit], '.1f') + ' ' + unit + 'iB'
+
+    return str(int(size_bytes)) + ' B'
+
+#resident memory of this process in bytes read from /proc, None where it is not available
+def rss_bytes():
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+#call a function and return its result with the peak number of bytes python and numpy allocated while it ran
+def traced_peak(function, *args):
+    tracemalloc.start()
+    try:
+        result = function(*args)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return result, peak
+
+#choose the most workers up to max_workers that can each convert batches of at least MINIMUM_BATCH_SIZE rows within a
+#memory budget, and the largest batch size up to max_batch_size that fits, the main process uses base_bytes and every
+#worker process is counted as a full copy of it although forked workers share pages with it until they are written, a
+#worker also needs fixed_bytes plus bytes_per_row for each row of a batch, with one worker the files are converted in the
+#main process, returns (batch_size, workers, limit) where limit is the memory each process converting files may use
+def plan(budget, base_bytes, fixed_bytes, bytes_per_row, max_batch_size, max_workers):
+    for workers in range(max_workers, 0, -1):
+        limit = (budget - base_bytes) // workers if workers > 1 else budget
+        room = limit - base_bytes - fixed_bytes
+        batch_size = min(max_batch_size, int(room // max(bytes_per_row, 1)))
+        if batch_size >= min(MINIMUM_BATCH_SIZE, max_batch_size):
+            return batch_size, workers, limit
+
+    raise ValueError("memory budget of " + format_size(budget) + " is too small, at least " +
+                     format_size(base_bytes + fixed_bytes + min(MINIMUM_BATCH_SIZE, max_batch_size) * bytes_per_row) +
+                     " is needed")
+
+#keeps the batch size of a process within its memory limit, when the resident memory nears the limit the batch size is
+#halved down to MINIMUM_BATCH_SIZE and once it falls well below the limit the batch size is doubled back up to the planned
+#size, without a limit the batch size is never changed, only writers that release each batch once it is written should be
+#governed as smaller batches free no memory for writers that keep every batch
+class MemoryGovernor:
+
+    def __init__(self, limit, batch_size):
+        self.limit = limit
+        self.planned_batch_size = batch_size
+        self.batch_size = batch_size
+        self.shrinks = 0
+
+    #check the resident memory after a batch is written and return the size of the next batch
+    def check(self):
+        rss = rss_bytes() if self.limit is not None else None
+        if rss is None:
+            return self.batch_size
+
+        if rss > self.limit * SHRINK_FRACTION and self.batch_size > MINIMUM_BATCH_SIZE:
+            self.batch_size = max(MINIMUM_BATCH_SIZE, self.batch_size // 2)
+            self.shrinks += 1
+        elif rss < self.limit * GROW_FRACTION and self.batch_size < self.planned_batch_size:
+            self.batch_size = min(self.planned_batch_size, self.batch_size * 2)
+
+        return self.batch_size
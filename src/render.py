@@ -0,0 +1,199 @@
+import fnmatch
+import glob
+import os
+import re
+import struct
+import zlib
+import numpy as np
+import laspy
+
+#projections of the quick-look images, sky is a Hammer-Aitoff map of the direction of each star seen from the sun and
+#faceon looks down on the disk along z
+PROJECTIONS = ['sky', 'faceon']
+
+#name of the buffer of counts and colour sums saved by each shard so the images of every shard can be merged, the suffix
+#keeps the buffers of preview builds from replacing those of full builds written to the same directory
+BUFFER_NAME = 'render-{projection}-{index}-of-{count}{suffix}.npz'
+
+#parse an image size given on the command line as WIDTHxHEIGHT
+def parse_size(size):
+    try:
+        width, height = (int(value) for value in size.lower().split('x'))
+    except ValueError:
+        raise ValueError("size must be given as WIDTHxHEIGHT, e.g. 2048x1024: " + size)
+    if width < 1 or height < 1:
+        raise ValueError("width and height must be at least 1: " + size)
+
+    return width, height
+
+#project cartesian coordinates onto the Hammer-Aitoff plane, returning coordinates in the range [-1, 1] with longitude
+#increasing to the left and latitude upwards as sky maps are drawn
+def hammer_aitoff(x, y, z):
+    longitude = np.arctan2(y, x)
+    latitude = np.arctan2(z, np.hypot(x, y))
+    scale = np.sqrt(1 + np.cos(latitude) * np.cos(longitude / 2))
+
+    return -np.cos(latitude) * np.sin(longitude / 2) / scale, np.sin(latitude) / scale
+
+#holds the number of stars and sums of their colours in each pixel of a fixed size image, batches of stars are added
+#with np.bincount so memory only depends on the number of pixels, buffers of the same image can be merged
+class RenderBuffer:
+
+    def __init__(self, projection, width, height, extent = 20.0):
+        if projection not in PROJECTIONS:
+            raise ValueError("unknown projection " + projection + ", choose from " + ', '.join(PROJECTIONS))
+        self.projection = projection
+        self.width = width
+        self.height = height
+        self.extent = extent
+        self.counts = np.zeros(width * height, dtype = np.int64)
+        self.colour_sums = np.zeros((3, width * height), dtype = np.float64)
+
+    #pixel of each star in the flattened image, -1 for stars outside the image
+    def pixels(self, columns):
+        if self.projection == 'sky':
+            u, v = hammer_aitoff(columns['x'], columns['y'], columns['z'])
+        else:
+            #x spans [-extent, extent] and y keeps the same scale so the disk is not stretched
+            u = columns['x'] / self.extent
+            v = columns['y'] / (self.extent * self.height / self.width)
+
+        #the edges of the image belong to its outermost pixels so the poles of the sky map are kept
+        column = np.minimum(np.floor((u + 1) / 2 * self.width), self.width - 1)
+        row = np.minimum(np.floor((1 - v) / 2 * self.height), self.height - 1)
+        inside = (np.abs(u) <= 1) & (np.abs(v) <= 1)
+
+        return np.where(inside, row * self.width + column, -1).astype(np.int64)
+
+    #add a batch of stars given as a dictionary of numpy arrays of x, y, z, red, green and blue
+    def add(self, columns):
+        pixels = self.pixels(columns)
+        inside = pixels >= 0
+        pixels = pixels[inside]
+
+        self.counts += np.bincount(pixels, minlength = len(self.counts))
+        for channel, name in enumerate(['red', 'green', 'blue']):
+            self.colour_sums[channel] += np.bincount(pixels, weights = np.asarray(columns[name], dtype = np.float64)[inside],
+                                                     minlength = len(self.counts))
+
+    #add the counts and colour sums of another buffer of the same image
+    def merge(self, other):
+        if (other.projection, other.width, other.height, other.extent) != (self.projection, self.width, self.height, self.extent):
+            raise ValueError("can not merge render buffers of different images")
+        self.counts += other.counts
+        self.colour_sums += other.colour_sums
+
+    #mean colour of the stars in each pixel as an array of shape (3, height, width), black where there are no stars
+    def mean_colour(self):
+        mean = self.colour_sums / np.maximum(self.counts, 1)
+
+        return mean.reshape(3, self.height, self.width)
+
+    #8 bit rgb image of shape (height, width, 3), each pixel has the mean colour of its stars scaled by the logarithm of
+    #their number so both sparse and dense regions stay visible
+    def image(self):
+        brightness = np.log1p(self.counts) / max(np.log1p(self.counts.max()), 1.0)
+        colour = self.mean_colour() * brightness.reshape(self.height, self.width)
+
+        return np.round(np.clip(colour, 0, 255)).astype(np.uint8).transpose(1, 2, 0)
+
+    #write the image as a png, or as a fits cube of the star counts and mean red, green and blue colour of each pixel
+    def write_image(self, path):
+        if path.lower().endswith('.fits'):
+            planes = np.concatenate([self.counts.reshape(1, self.height, self.width), self.mean_colour()])
+            write_fits(path, planes, ['COUNT', 'RED', 'GREEN', 'BLUE'])
+        else:
+            write_png(path, self.image())
+
+    #save the counts and colour sums so the buffer can be merged with those of other shards
+    def save(self, path):
+        np.savez(path, projection = self.projection, size = [self.width, self.height], extent = self.extent,
+                 counts = self.counts, colour_sums = self.colour_sums)
+
+    #load a buffer saved by save
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as saved:
+            buffer = cls(str(saved['projection']), int(saved['size'][0]), int(saved['size'][1]), float(saved['extent']))
+            buffer.counts += saved['counts']
+            buffer.colour_sums += saved['colour_sums']
+
+        return buffer
+
+#add the stars of every las file in a directory matching a pattern, but not the exclude pattern if one is given, to a
+#buffer, reading a chunk of points at a time
+def render_las_files(buffer, directory, pattern = '*.las', chunk_size = 1000000, exclude = None):
+    las_files = [las_file for las_file in sorted(glob.glob(os.path.join(directory, pattern)))
+                 if exclude is None or not fnmatch.fnmatch(os.path.basename(las_file), exclude)]
+    for las_file in las_files:
+        with laspy.open(las_file) as reader:
+            for points in reader.chunk_iterator(chunk_size):
+                buffer.add({'x': np.asarray(points.x), 'y': np.asarray(points.y), 'z': np.asarray(points.z),
+                            'red': np.asarray(points.red), 'green': np.asarray(points.green),
+                            'blue': np.asarray(points.blue)})
+
+    return las_files
+
+#merge the buffers saved by every shard for a projection in a directory, returns None if there are none, raises
+#ValueError unless there is exactly one buffer for every shard of a single build, as buffers left behind by a build with
+#another number of shards or by a preview build, which has its own suffix, would otherwise be merged in too
+def merge_buffers(directory, projection, suffix = ''):
+    name = BUFFER_NAME.format(projection = projection, index = '*', count = '*', suffix = suffix)
+    name_pattern = re.compile(re.escape(name).replace(r'\*', r'(\d+)') + '$')
+    shards = {}
+    for path in sorted(glob.glob(os.path.join(directory, name))):
+        match = name_pattern.match(os.path.basename(path))
+        if match is not None:
+            shards.setdefault(int(match.group(2)), {}).setdefault(int(match.group(1)), []).append(path)
+    if not shards:
+        return None
+
+    problems = []
+    if len(shards) > 1:
+        problems.append("buffers of builds with " + ' and '.join(str(count) for count in sorted(shards)) + " shards")
+    for count, indexes in sorted(shards.items()):
+        for index in range(count):
+            if index not in indexes:
+                problems.append("shard " + str(index) + "/" + str(count) + " has no buffer")
+            elif len(indexes[index]) > 1:
+                problems.append("shard " + str(index) + "/" + str(count) + " has more than one buffer")
+        for index in sorted(set(indexes) - set(range(count))):
+            problems.append("shard " + str(index) + "/" + str(count) + " is not a shard of the build")
+    if problems:
+        raise ValueError(projection + " render buffers in " + directory + " can not be merged: " + ', '.join(problems))
+
+    (count, indexes), = shards.items()
+    buffer = RenderBuffer.load(indexes[0][0])
+    for index in range(1, count):
+        buffer.merge(RenderBuffer.load(indexes[index][0]))
+
+    return buffer
+
+#write an 8 bit rgb image of shape (height, width, 3) as a png file, each row is stored without filtering
+def write_png(path, image):
+    height, width = image.shape[:2]
+    rows = np.concatenate([np.zeros((height, 1), dtype = np.uint8), image.reshape(height, width * 3)], axis = 1)
+
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+    with open(path, 'wb') as png_file:
+        png_file.write(b'\x89PNG\r\n\x1a\n')
+        png_file.write(chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)))
+        png_file.write(chunk(b'IDAT', zlib.compress(rows.tobytes(), 6)))
+        png_file.write(chunk(b'IEND', b''))
+
+#write planes of shape (planes, height, width) as a 32 bit float fits image cube, fits images start from the bottom row
+#so the rows are flipped to keep north or +y upwards
+def write_fits(path, planes, names):
+    cards = ['SIMPLE  = %20s' % 'T', 'BITPIX  = %20d' % -32, 'NAXIS   = %20d' % 3,
+             'NAXIS1  = %20d' % planes.shape[2], 'NAXIS2  = %20d' % planes.shape[1], 'NAXIS3  = %20d' % planes.shape[0]]
+    cards += ["PLANE%-3d= '%-8s'" % (index + 1, name) for index, name in enumerate(names)]
+    cards.append('END')
+    header = ''.join(card.ljust(80) for card in cards)
+    header = header.ljust(-(-len(header) // 2880) * 2880)
+
+    data = np.ascontiguousarray(planes[:, ::-1, :], dtype = '>f4').tobytes()
+    with open(path, 'wb') as fits_file:
+        fits_file.write(header.encode('ascii'))
+        fits_file.write(data + b'\x00' * (-len(data) % 2880))
@@ -0,0 +1,209 @@
+import math
+import numpy as np
+
+#columns summarised while converting with the range (lower, upper, bins) of their fixed-bin histograms, distance is the
+#distance of each star from the sun found from x, y and z
+STATISTICS_COLUMNS = {
+    'x': (-50.0, 50.0, 200),
+    'y': (-50.0, 50.0, 200),
+    'z': (-50.0, 50.0, 200),
+    'distance': (0.0, 50.0, 200),
+    'temperature': (0.0, 40000.0, 200),
+    }
+
+#quantiles reported in the manifest for every column
+REPORTED_QUANTILES = [0.001, 0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99, 0.999]
+
+#compression of the quantile sketches, a sketch keeps at most about compression / 2 centroids
+SKETCH_COMPRESSION = 200
+
+#quantile sketch in the style of a merging t-digest, values are summarised by centroids of a mean and a weight kept in
+#order of their means, centroids near the median may hold many values while those near the ends hold few so extreme
+#quantiles stay accurate, sketches of different batches are merged by compressing their centroids together
+class QuantileSketch:
+
+    def __init__(self, compression = SKETCH_COMPRESSION):
+        self.compression = compression
+        self.means = np.empty(0)
+        self.weights = np.empty(0)
+        self.minimum = math.inf
+        self.maximum = -math.inf
+
+    #add an array of finite values
+    def add(self, values):
+        if len(values) == 0:
+            return
+        self.minimum = min(self.minimum, float(values.min()))
+        self.maximum = max(self.maximum, float(values.max()))
+        self.compress(np.concatenate([self.means, values]), np.concatenate([self.weights, np.ones(len(values))]))
+
+    #add the centroids of another sketch
+    def merge(self, other):
+        if len(other.means) == 0:
+            return
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+        self.compress(np.concatenate([self.means, other.means]), np.concatenate([self.weights, other.weights]))
+
+    #sort centroids by their means and combine neighbours that fall in the same unit of the arcsine scale function of
+    #their quantile, which is steep near the ends and flat near the median
+    def compress(self, means, weights):
+        order = np.argsort(means, kind = 'stable')
+        means, weights = means[order], weights[order]
+        middle = (np.cumsum(weights) - weights / 2) / weights.sum()
+        groups = np.floor(self.compression / (2 * math.pi) * np.arcsin(2 * middle - 1))
+        groups = np.unique(groups, return_inverse = True)[1]
+
+        self.weights = np.bincount(groups, weights = weights)
+        self.means = np.bincount(groups, weights = means * weights) / self.weights
+
+    #estimate the value at a quantile from 0 to 1 by interpolating between the centres of the centroids, the minimum and
+    #maximum, nan if the sketch is empty
+    def quantile(self, q):
+        if len(self.means) == 0:
+            return math.nan
+        total = self.weights.sum()
+        centres = np.cumsum(self.weights) - self.weights / 2
+
+        return float(np.interp(q * total, np.r_[0, centres, total], np.r_[self.minimum, self.means, self.maximum]))
+
+#streaming summary of one column with its count of values and missing values, minimum, maximum, mean and variance kept
+#with Welford's method, a fixed-bin histogram with counts of values below and above its range and a quantile sketch, every
+#part can be merged with the summary of another batch or worker
+class ColumnSummary:
+
+    def __init__(self, lower, upper, bins):
+        self.lower = lower
+        self.upper = upper
+        self.count = 0
+        self.missing = 0
+        self.minimum = math.inf
+        self.maximum = -math.inf
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.histogram = np.zeros(bins, dtype = np.int64)
+        self.below = 0
+        self.above = 0
+        self.sketch = QuantileSketch()
+
+    #add an array of values, nan values are counted as missing
+    def add(self, values):
+        values = np.asarray(values, dtype = np.float64)
+        finite = values[np.isfinite(values)]
+        self.missing += len(values) - len(finite)
+        if len(finite) == 0:
+            return
+
+        batch_mean = float(finite.mean())
+        self.combine_moments(len(finite), batch_mean, float(np.sum((finite - batch_mean) ** 2)))
+        self.minimum = min(self.minimum, float(finite.min()))
+        self.maximum = max(self.maximum, float(finite.max()))
+        self.histogram += np.histogram(finite, bins = len(self.histogram), range = (self.lower, self.upper))[0]
+        self.below += int(np.count_nonzero(finite < self.lower))
+        self.above += int(np.count_nonzero(finite > self.upper))
+        self.sketch.add(finite)
+
+    #combine the count, mean and sum of squared differences from the mean of other values with those of this summary
+    def combine_moments(self, count, mean, m2):
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + delta ** 2 * self.count * count / total
+        self.count = total
+
+    #add the summary of the same column of another batch or worker
+    def merge(self, other):
+        self.missing += other.missing
+        if other.count == 0:
+            return
+        self.combine_moments(other.count, other.mean, other.m2)
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+        self.histogram += other.histogram
+        self.below += other.below
+        self.above += other.above
+        self.sketch.merge(other.sketch)
+
+    #variance of the values, nan for fewer than two values
+    def variance(self):
+        return self.m2 / (self.count - 1) if self.count > 1 else math.nan
+
+    #summary as a dictionary for json, the quantiles estimated from the sketch are included for readers of the manifest
+    def to_dict(self):
+        return {
+            'count': self.count, 'missing': self.missing,
+            'min': self.minimum if self.count else None, 'max': self.maximum if self.count else None,
+            'mean': self.mean if self.count else None, 'm2': self.m2,
+            'std': math.sqrt(self.variance()) if self.count > 1 else None,
+            'quantiles': {format(q, 'g'): self.sketch.quantile(q) for q in REPORTED_QUANTILES} if self.count else {},
+            'histogram': {'range': [self.lower, self.upper], 'counts': self.histogram.tolist(), 'below': self.below,
+                          'above': self.above},
+            'sketch': {'compression': self.sketch.compression, 'means': self.sketch.means.tolist(),
+                       'weights': self.sketch.weights.tolist()},
+            }
+
+    #summary read from a dictionary written by to_dict
+    @classmethod
+    def from_dict(cls, summary):
+        histogram = summary['histogram']
+        column_summary = cls(histogram['range'][0], histogram['range'][1], len(histogram['counts']))
+        column_summary.count = summary['count']
+        column_summary.missing = summary['missing']
+        if summary['count']:
+            column_summary.minimum = summary['min']
+            column_summary.maximum = summary['max']
+            column_summary.mean = summary['mean']
+        column_summary.m2 = summary['m2']
+        column_summary.histogram += np.array(histogram['counts'], dtype = np.int64)
+        column_summary.below = histogram['below']
+        column_summary.above = histogram['above']
+        column_summary.sketch = QuantileSketch(summary['sketch']['compression'])
+        column_summary.sketch.means = np.array(summary['sketch']['means'], dtype = np.float64)
+        column_summary.sketch.weights = np.array(summary['sketch']['weights'], dtype = np.float64)
+        column_summary.sketch.minimum = column_summary.minimum
+        column_summary.sketch.maximum = column_summary.maximum
+
+        return column_summary
+
+#summaries of every column in STATISTICS_COLUMNS kept while batches of stars are written
+class BatchStatistics:
+
+    def __init__(self):
+        self.columns = {name: ColumnSummary(*histogram) for name, histogram in STATISTICS_COLUMNS.items()}
+
+    #add a batch of stars given as a dictionary of numpy arrays of x, y, z and temperature
+    def add(self, columns):
+        for name, column_summary in self.columns.items():
+            if name == 'distance':
+                column_summary.add(np.sqrt(columns['x'] ** 2 + columns['y'] ** 2 + columns['z'] ** 2))
+            else:
+                column_summary.add(columns[name])
+
+    #add the statistics of another file, worker or shard
+    def merge(self, other):
+        for name, column_summary in self.columns.items():
+            column_summary.merge(other.columns[name])
+
+    #statistics as a dictionary for json
+    def to_dict(self):
+        return {name: column_summary.to_dict() for name, column_summary in self.columns.items()}
+
+    #statistics read from a dictionary written by to_dict
+    @classmethod
+    def from_dict(cls, statistics):
+        batch_statistics = cls()
+        for name in batch_statistics.columns:
+            batch_statistics.columns[name] = ColumnSummary.from_dict(statistics[name])
+
+        return batch_statistics
+
+#combine statistics written by to_dict, returns None if there are none
+def combine_statistics(statistics_list):
+    combined = None
+    for statistics in statistics_list:
+        if combined is None:
+            combined = BatchStatistics.from_dict(statistics)
+        else:
+            combined.merge(BatchStatistics.from_dict(statistics))
+
+    return combined.to_dict() if combined is not None else None
@@ -0,0 +1,150 @@
+import collections
+import os
+import numpy as np
+import laspy
+import writers
+
+#Gaia source ids hold the nested HEALPix pixel of the star at order 12 in the bits above bit 35, the pixel at a lower
+#order is found by dropping two bits for each order as every pixel is split into four at the next order
+SOURCE_ID_HEALPIX_ORDER = 12
+SOURCE_ID_HEALPIX_SHIFT = 35
+
+#name of the las file of one tile, the suffix keeps shards and preview builds from writing to the same file
+TILE_FILE_NAME = 'healpix{order}-{pixel}{suffix}.las'
+
+#nested HEALPix pixel of each source id at an order from 0 to 12
+def healpix_pixels(source_ids, order):
+    if not 0 <= order <= SOURCE_ID_HEALPIX_ORDER:
+        raise ValueError("HEALPix order must be in the range 0 to " + str(SOURCE_ID_HEALPIX_ORDER) + ": " + str(order))
+    shift = SOURCE_ID_HEALPIX_SHIFT + 2 * (SOURCE_ID_HEALPIX_ORDER - order)
+
+    return np.asarray(source_ids, dtype = np.uint64) >> np.uint64(shift)
+
+#range of source ids [first, last] in a pixel, used to find the tiles of a sky region or of a range of source ids
+def source_id_range(pixel, order):
+    shift = SOURCE_ID_HEALPIX_SHIFT + 2 * (SOURCE_ID_HEALPIX_ORDER - order)
+
+    return pixel << shift, ((pixel + 1) << shift) - 1
+
+#streams batches of points into one las file per HEALPix tile, only a bounded number of tile files are kept open, the
+#least recently written is closed when another has to be opened and is reopened in append mode when it is written to
+#again, tile files written by an earlier run are overwritten the first time they are opened
+class TileWriterPool:
+
+    def __init__(self, directory, order, attributes = (), max_open_files = 64, suffix = '', settings = None):
+        self.directory = directory
+        self.order = order
+        self.attributes = attributes
+        self.max_open_files = max_open_files
+        self.suffix = suffix
+        self.header = writers.create_header(attributes, settings)
+        self.open_files = collections.OrderedDict()
+        self.tiles = {}
+
+    #name of the las file of a pixel
+    def file_name(self, pixel):
+        return TILE_FILE_NAME.format(order = self.order, pixel = pixel, suffix = self.suffix)
+
+    #writer of a tile file, opening it and closing the least recently written file if too many are open
+    def tile_writer(self, pixel):
+        if pixel in self.open_files:
+            self.open_files.move_to_end(pixel)
+            return self.open_files[pixel]
+
+        while len(self.open_files) >= self.max_open_files:
+            self.open_files.popitem(last = False)[1].close()
+
+        path = os.path.join(self.directory, self.file_name(pixel))
+        if pixel in self.tiles:
+            tile_writer = laspy.open(path, mode = 'a')
+        else:
+            tile_writer = laspy.open(path, mode = 'w', header = self.header)
+            self.tiles[pixel] = {'points': 0, 'mins': np.full(3, np.iinfo(np.int32).max, dtype = np.int64),
+                                 'maxs': np.full(3, np.iinfo(np.int32).min, dtype = np.int64)}
+        self.open_files[pixel] = tile_writer
+
+        return tile_writer
+
+    #write a batch of points given as a dictionary of numpy arrays, the points are grouped by tile with a stable sort so
+    #each tile receives its points in the order they were read, returns the number of points written to each tile file
+    def write(self, columns):
+        if len(columns['x']) == 0:
+            return {}
+
+        pixels = healpix_pixels(columns['source_id'], self.order)
+        order = np.argsort(pixels, kind = 'stable')
+        pixels = pixels[order]
+        starts = np.flatnonzero(np.r_[True, pixels[1:] != pixels[:-1]])
+        ends = np.r_[starts[1:], len(pixels)]
+
+        counts = {}
+        for start, end in zip(starts, ends):
+            pixel = int(pixels[start])
+            tile_columns = {name: values[order[start:end]] for name, values in columns.items()}
+            tile_writer = self.tile_writer(pixel)
+
+            points = laspy.ScaleAwarePointRecord.zeros(end - start, header = self.header)
+            writers.fill_records(points.array, self.header, tile_columns, self.attributes)
+            if isinstance(tile_writer, laspy.lasappender.LasAppender):
+                tile_writer.append_points(points)
+            else:
+                tile_writer.write_points(points)
+
+            tile = self.tiles[pixel]
+            tile['points'] += end - start
+            for axis, name in enumerate(['X', 'Y', 'Z']):
+                tile['mins'][axis] = min(tile['mins'][axis], points.array[name].min())
+                tile['maxs'][axis] = max(tile['maxs'][axis], points.array[name].max())
+            counts[self.file_name(pixel)] = int(end - start)
+
+        return counts
+
+    #close every open tile file and return the index of tiles, mapping each tile file to its pixel, number of points and
+    #bounds
+    def close(self):
+        while self.open_files:
+            self.open_files.popitem(last = False)[1].close()
+
+        index = {}
+        for pixel, tile in sorted(self.tiles.items()):
+            index[self.file_name(pixel)] = {
+                'pixel': pixel,
+                'points': int(tile['points']),
+                'bounds': [(tile['mins'] * self.header.scales + self.header.offsets).tolist(),
+                           (tile['maxs'] * self.header.scales + self.header.offsets).tolist()],
+                }
+
+        return index
+
+#writes the batches of one GaiaSource file into the tiles of a pool with the same interface as the writers of whole las
+#files, keeping the number of points written to each tile and the bounds of the file for its manifest entry
+class TileFileWriter:
+
+    #batches are written to the tile files straight away
+    keeps_batches = False
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.tiles = collections.Counter()
+        self.mins = np.full(3, np.inf)
+        self.maxs = np.full(3, -np.inf)
+
+    #write a batch of points given as a dictionary of numpy arrays
+    def write(self, columns):
+        if len(columns['x']) == 0:
+            return
+        self.tiles.update(self.pool.write(columns))
+        for axis, name in enumerate(['x', 'y', 'z']):
+            self.mins[axis] = min(self.mins[axis], columns[name].min())
+            self.maxs[axis] = max(self.maxs[axis], columns[name].max())
+
+    #return the number of points and bounds of the file rounded to the scale of the las files, the tile files stay open in
+    #the pool
+    def close(self):
+        point_count = sum(self.tiles.values())
+        if point_count == 0:
+            return 0, None
+        header = self.pool.header
+
+        return int(point_count), [(np.round((self.mins - header.offsets) / header.scales) * header.scales + header.offsets).tolist(),
+                                  (np.round((self.maxs - header.offsets) / header.scales) * header.scales + header.offsets).tolist()]
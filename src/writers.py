@@ -0,0 +1,189 @@
+import json
+import numpy as np
+import laspy
+
+#extra dimensions in las file for storing meta data of each star
+EXTRA_DIMENSIONS = [
+    ("solution_id", "uint64"),
+    ("designation", "uint64"),
+    ("source_id", "uint64"),
+    ]
+
+#optional physical attributes of each star stored as compact scaled integer extra dimensions, as las extra bytes have
+#no 16 bit float type, each is (type, scale, offset, description) where the real value is raw * scale + offset and the
+#largest raw value of the type marks missing data, values that do not fit the range of the type, such as distances beyond
+#65.534 kpc, are stored as missing data too rather than saturating at the ends of the range
+ATTRIBUTES = {
+    'temperature': ('uint16', 10.0, 0.0, 'Temperature in K'),
+    'magnitude': ('uint8', 0.1, -2.0, 'G magnitude'),
+    'distance': ('uint16', 0.001, 0.0, 'Distance in kpc'),
+    'distance_error': ('uint8', 0.01, 0.0, 'Relative distance error'),
+    }
+
+#the intensity attribute uses the standard las intensity field for brightness, G magnitudes from the faint to the bright
+#end of this range are mapped linearly onto 0 to 65535
+INTENSITY_MAGNITUDE_RANGE = (21.0, -1.5)
+
+#scale in kpc of the x, y and z coordinates stored as 32 bit integers in the las point records, coordinates further than
+#COORDINATE_LIMIT from the origin along an axis can not be stored
+COORDINATE_SCALE = 0.01
+COORDINATE_LIMIT = (np.iinfo(np.int32).max - 1) * COORDINATE_SCALE
+
+#user id and record id of the variable length record holding the conversion settings that change how the values of each
+#star were calculated, such as the temperature estimator, as json
+SETTINGS_VLR_USER_ID = 'galaxy-las'
+SETTINGS_VLR_RECORD_ID = 1
+
+#create las header with the extra dimensions used for every output file, the optional attributes and a record of the
+#conversion settings
+def create_header(attributes = (), settings = None):
+    header = laspy.LasHeader(version = "1.4", point_format = 2)
+    header.scales = np.full(3, COORDINATE_SCALE)
+    header.offsets = np.zeros(3)
+    extra_bytes = [laspy.ExtraBytesParams(name = name, type = type) for name, type in EXTRA_DIMENSIONS]
+    for name in attributes:
+        if name in ATTRIBUTES:
+            type, scale, offset, description = ATTRIBUTES[name]
+            extra_bytes.append(laspy.ExtraBytesParams(name = name, type = type, description = description,
+                                                      scales = np.array([scale]), offsets = np.array([offset]),
+                                                      no_data = np.array([np.iinfo(type).max])))
+    header.add_extra_dims(extra_bytes)
+    if settings is not None:
+        header.vlrs.append(laspy.VLR(SETTINGS_VLR_USER_ID, SETTINGS_VLR_RECORD_ID, 'Conversion settings',
+                                     json.dumps(settings, sort_keys = True).encode()))
+
+    return header
+
+#conversion settings recorded in a las header, None if it has no record of them
+def read_settings(header):
+    for vlr in header.vlrs:
+        if vlr.user_id == SETTINGS_VLR_USER_ID and vlr.record_id == SETTINGS_VLR_RECORD_ID:
+            return json.loads(vlr.record_data)
+
+    return None
+
+#scale a batch of points given as a dictionary of numpy arrays of x, y, z, red, green, blue, the extra dimensions and the
+#optional attributes into point records of the header's point format, raises OverflowError rather than wrapping around
+#if a coordinate does not fit the 32 bit integers of the point records
+def fill_records(records, header, columns, attributes):
+    for axis, name in enumerate(['X', 'Y', 'Z']):
+        raw = np.round((columns[name.lower()] - header.offsets[axis]) / header.scales[axis])
+        if not np.all((raw >= np.iinfo(np.int32).min) & (raw <= np.iinfo(np.int32).max)):
+            raise OverflowError(name.lower() + " coordinates beyond the range of the las point records")
+        records[name] = raw.astype(np.int32)
+    for name in ['red', 'green', 'blue'] + [name for name, type in EXTRA_DIMENSIONS]:
+        records[name] = columns[name]
+
+    for name in attributes:
+        if name == 'intensity':
+            faint, bright = INTENSITY_MAGNITUDE_RANGE
+            brightness = np.nan_to_num((columns[name] - faint) / (bright - faint), nan = 0.0)
+            records[name] = np.round(np.clip(brightness, 0, 1) * np.iinfo(np.uint16).max)
+        else:
+            type, scale, offset, description = ATTRIBUTES[name]
+            no_data = np.iinfo(type).max
+            raw = np.round((columns[name] - offset) / scale)
+            records[name] = np.where((raw >= 0) & (raw < no_data), raw, no_data)
+
+#collects batches of points then builds a laspy.LasData and writes it in one go when closed, the whole file is held in
+#memory and every point is copied into the LasData and again when it is serialised
+class LasDataWriter:
+
+    #the point count bound is not used as the las file is only sized when it is written, and every batch is kept until
+    #then so smaller batches do not lower the memory used
+    preallocates = False
+    keeps_batches = True
+
+    def __init__(self, path, point_count_bound, attributes = (), settings = None):
+        self.path = path
+        self.attributes = attributes
+        self.settings = settings
+        self.batches = []
+
+    #add a batch of points given as a dictionary of numpy arrays
+    def write(self, columns):
+        self.batches.append(columns)
+
+    #write the las file and return its number of points and bounds
+    def close(self):
+        header = create_header(self.attributes, self.settings)
+        points = laspy.ScaleAwarePointRecord.zeros(sum(len(batch['x']) for batch in self.batches), header = header)
+        if self.batches:
+            columns = {name: np.concatenate([batch[name] for batch in self.batches]) for name in self.batches[0]}
+            fill_records(points.array, header, columns, self.attributes)
+
+        galaxy_data = laspy.LasData(header, points = points)
+        galaxy_data.update_header()
+        galaxy_data.write(self.path)
+
+        return point_summary(galaxy_data.header)
+
+#preallocates the las file for an upper bound of points and memory-maps its point records as a numpy structured array,
+#every batch is scaled and written straight into the mapped records, when closed the header is rewritten with the
+#actual point count and bounds and the file is truncated to the points that were written
+class MemmapLasWriter:
+
+    #the las file is sized for the point count bound so it must be an upper bound of the points written
+    preallocates = True
+    keeps_batches = False
+
+    def __init__(self, path, point_count_bound, attributes = (), settings = None):
+        self.path = path
+        self.attributes = attributes
+        self.header = create_header(attributes, settings)
+        self.point_count = 0
+        self.mins = np.full(3, np.iinfo(np.int32).max, dtype = np.int64)
+        self.maxs = np.full(3, np.iinfo(np.int32).min, dtype = np.int64)
+
+        with open(path, 'wb') as las_file:
+            self.header.write_to(las_file)
+            las_file.truncate(self.header.offset_to_point_data + point_count_bound * self.header.point_format.size)
+
+        self.points = None
+        if point_count_bound > 0:
+            self.points = np.memmap(path, dtype = self.header.point_format.dtype(), mode = 'r+',
+                                    offset = self.header.offset_to_point_data, shape = (point_count_bound,))
+
+    #write a batch of points given as a dictionary of numpy arrays
+    def write(self, columns):
+        batch_size = len(columns['x'])
+        if batch_size == 0:
+            return
+        if self.points is None or self.point_count + batch_size > len(self.points):
+            raise Exception("more points than the preallocated " + str(0 if self.points is None else len(self.points)))
+
+        records = self.points[self.point_count:self.point_count + batch_size]
+        fill_records(records, self.header, columns, self.attributes)
+        for axis, name in enumerate(['X', 'Y', 'Z']):
+            self.mins[axis] = min(self.mins[axis], records[name].min())
+            self.maxs[axis] = max(self.maxs[axis], records[name].max())
+
+        self.point_count += batch_size
+
+    #rewrite the header with the point count and bounds, truncate the file and return its number of points and bounds
+    def close(self):
+        if self.points is not None:
+            self.points.flush()
+            del self.points
+            self.points = None
+
+        self.header.point_count = self.point_count
+        if self.point_count > 0:
+            self.header.mins = self.mins * self.header.scales + self.header.offsets
+            self.header.maxs = self.maxs * self.header.scales + self.header.offsets
+
+        with open(self.path, 'r+b') as las_file:
+            self.header.write_to(las_file, ensure_same_size = True)
+            las_file.truncate(self.header.offset_to_point_data + self.point_count * self.header.point_format.size)
+
+        return point_summary(self.header)
+
+#number of points and bounds of a written las file for its manifest entry, bounds are None for an empty file
+def point_summary(header):
+    if header.point_count == 0:
+        return 0, None
+
+    return int(header.point_count), [header.mins.tolist(), header.maxs.tolist()]
+
+#writers selectable on the command line
+WRITERS = {'lasdata': LasDataWriter, 'memmap': MemmapLasWriter}
@@ -1,13 +1,189 @@
+import collections
+import contextlib
+import io
+import json
+import math
+import os
+import sys
+import tempfile
 import unittest
+from argparse import Namespace
+from unittest import mock
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+import galaxy
+
+SAMPLE_CSV = (
+    "solution_id,designation,source_id,parallax,parallax_over_error,phot_g_mean_mag,l,b\n"
+    "1,Gaia DR3 100,100,2.0,10.0,12.0,1.0,0.5\n"
+    "1,Gaia DR3 200,200,,,19.0,1.0,0.5\n"
+    "1,Gaia DR3 300,300,0.1,3.0,15.0,1.0,0.5\n"
+    "1,Gaia DR3 400,400,1.0,20.0,20.5,1.0,0.5\n"
+)
+
+CONVERT_CSV = (
+    "solution_id,designation,source_id,parallax,phot_g_mean_mag,l,b,nu_eff_used_in_astrometry,pseudocolour\n"
+    "1,Gaia DR3 100,100,2.0,12.0,1.0,0.5,1.5,\n"
+    "1,Gaia DR3 200,200,0.5,19.0,120.0,-30.0,,1.6"
+)
+
+def filter_args(**kwargs):
+    args = Namespace(preview=None, colour='table', min_parallax_over_error=None, max_magnitude=None, max_distance=None)
+    vars(args).update(kwargs)
+    return args
 
 class TestGalaxy(unittest.TestCase):
 
     def test_calculateCartesian(self):
-        self.assertEqual()
+        #l and b are in degrees, parallax in mas gives distances in kpc
+        for l, b, parallax, expected in [('0', '0', '2.0', (0.5, 0, 0)), ('90', '0', '1.0', (0, 1, 0)),
+                                         ('180', '-30', '1.0', (-math.sqrt(3) / 2, 0, -0.5)), ('45', '90', '0.5', (0, 0, 2))]:
+            coordinates = galaxy.calculate_cartesian({'l': l, 'b': b, 'parallax': parallax})
+            for value, expected_value in zip(coordinates, expected):
+                self.assertAlmostEqual(value, expected_value)
+        self.assertRaises(Exception, galaxy.calculate_cartesian, {'l': '0', 'b': '0', 'parallax': ''})
     
     def test_calculateRGB(self):
         self.assertEqual()
 
+    def test_filteredRowsQualityCuts(self):
+        rows = galaxy.filtered_rows(io.StringIO(SAMPLE_CSV), filter_args(min_parallax_over_error=5, max_magnitude=20))
+        self.assertEqual([(i, row['source_id']) for i, row in rows], [(1, '100')])
+
+        rejected = collections.Counter()
+        rows = galaxy.filtered_rows(io.StringIO(SAMPLE_CSV), filter_args(max_distance=5), rejected)
+        self.assertEqual([row['source_id'] for i, row in rows], ['100', '400'])
+        self.assertEqual(rejected, {'distance': 2})
+
+    def test_filteredRowsOnlyDecodeSurvivors(self):
+        args = filter_args(min_parallax_over_error=5, max_magnitude=20)
+        with mock.patch.object(galaxy.csv, 'reader', side_effect = galaxy.csv.reader) as reader:
+            rows = list(galaxy.filtered_rows(io.StringIO(SAMPLE_CSV), args))
+        self.assertEqual([(i, row['parallax']) for i, row in rows], [(1, '2.0')])
+        #the header and the one row that survives the cuts
+        self.assertEqual(reader.call_count, 2)
+
+        #quoted fields may hold commas before the fields that are tested
+        quoted_csv = SAMPLE_CSV.replace('Gaia DR3 300', '"Gaia, DR3 300"').replace('15.0', '14.0').replace('3.0', '30.0')
+        rows = galaxy.filtered_rows(io.StringIO(quoted_csv), args)
+        self.assertEqual([row['designation'] for i, row in rows], ['Gaia DR3 100', 'Gaia, DR3 300'])
+
+        #quoted fields after the tested fields, and quoted fields without commas before them, do not need csv decoding
+        header, *lines = SAMPLE_CSV.replace('Gaia DR3 100', '"Gaia DR3 100"').replace(',10.0,', ',"10.0",').splitlines()
+        quoted_csv = header + ',libname_gspphot\n' + "".join(line + ',"a, ""b"""\n' for line in lines)
+        with mock.patch.object(galaxy.csv, 'reader', side_effect = galaxy.csv.reader) as reader:
+            rows = list(galaxy.filtered_rows(io.StringIO(quoted_csv), args))
+        self.assertEqual([(row['designation'], row['libname_gspphot']) for i, row in rows], [('Gaia DR3 100', 'a, "b"')])
+        self.assertEqual(reader.call_count, 2)
+
+    def test_filteredRowsPreviewIsDeterministic(self):
+        source_ids = range(1, 20001)
+        sample_csv = "solution_id,designation,source_id\n" + "".join("1,Gaia DR3 %d,%d\n" % (s, s) for s in source_ids)
+
+        first = [row['source_id'] for i, row in galaxy.filtered_rows(io.StringIO(sample_csv), filter_args(preview=0.1))]
+        second = [row['source_id'] for i, row in galaxy.filtered_rows(io.StringIO(sample_csv), filter_args(preview=0.1))]
+        self.assertEqual(first, second)
+        self.assertAlmostEqual(len(first) / len(source_ids), 0.1, delta=0.01)
+
+        everything = list(galaxy.filtered_rows(io.StringIO(sample_csv), filter_args(preview=1.0)))
+        self.assertEqual(len(everything), len(source_ids))
+
+    def test_coordinatesBeyondLasRangeAreRejected(self):
+        row = {'parallax': '1e-9', 'l': '0.0', 'b': '0.0'}
+        self.assertRaises(Exception, galaxy.calculate_cartesian, row)
+        row['parallax'] = '1e-7'
+        self.assertAlmostEqual(galaxy.calculate_cartesian(row)[0], 1e7)
+
+    def test_distanceIsMissingForNonPositiveParallax(self):
+        for parallax, distance in [('2.0', 0.5), ('0.0', None), ('-0.5', None)]:
+            attribute_values = galaxy.calculate_attributes({'parallax': parallax}, ['distance'])
+            if distance is None:
+                self.assertTrue(np.isnan(attribute_values['distance']))
+            else:
+                self.assertEqual(attribute_values['distance'], distance)
+
+    def test_countRowsCountsUnterminatedLastRow(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'rows.csv')
+            for text, rows in [('', 0), ('header', 0), ('header\n', 0), ('header\n1\n2\n', 2), ('header\n1\n2', 2)]:
+                with open(path, 'w') as csv_file:
+                    csv_file.write(text)
+                self.assertEqual(galaxy.count_rows(path), rows)
+
+    def test_memmapConversionOfUnterminatedFile(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, 'GaiaSource_000.csv'), 'w') as csv_file:
+                csv_file.write(CONVERT_CSV)
+            argv = ['convert', '--input', directory, '--output', os.path.join(directory, 'out'), '--writer', 'memmap']
+
+            #a failed file leaves no partly written las file behind
+            with mock.patch.object(galaxy, 'count_rows', return_value = 1):
+                galaxy.main(argv)
+            self.assertFalse(os.path.exists(os.path.join(directory, 'out', 'GaiaSource_000.csv.las')))
+
+            galaxy.main(argv)
+            with open(os.path.join(directory, 'out', 'manifest-0-of-1.json')) as manifest_file:
+                entry = json.load(manifest_file)['files']['GaiaSource_000.csv']
+            self.assertEqual((entry['rows'], entry['points'], entry['rejected']), (2, 2, {}))
+
+    def test_rowsAreOnlyCountedForPreallocatingWriters(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, 'GaiaSource_000.csv'), 'w') as csv_file:
+                csv_file.write(CONVERT_CSV)
+            with mock.patch.object(galaxy, 'count_rows', side_effect = galaxy.count_rows) as count_rows:
+                galaxy.main(['convert', '--input', directory, '--output', directory, '--writer', 'lasdata'])
+                self.assertEqual(count_rows.call_count, 0)
+                galaxy.main(['convert', '--input', directory, '--output', directory, '--writer', 'memmap'])
+                self.assertEqual(count_rows.call_count, 1)
+
+    def test_onlyWritersThatReleaseBatchesAreGoverned(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, 'GaiaSource_000.csv'), 'w') as csv_file:
+                csv_file.write(CONVERT_CSV.splitlines()[0] + '\n' + (CONVERT_CSV.splitlines()[1] + '\n') * 5000)
+            #a memory limit of one byte is always exceeded
+            for writer, shrunk in [('lasdata', False), ('memmap', True)]:
+                with mock.patch.object(galaxy, 'plan_memory', return_value = (2000, 1, 1)):
+                    with contextlib.redirect_stdout(io.StringIO()) as output:
+                        galaxy.main(['convert', '--input', directory, '--output', directory, '--writer', writer,
+                                     '--memory-budget', '1G'])
+                self.assertEqual("batches were shrunk 1 times" in output.getvalue(), shrunk)
+
+    def test_renderKeepsFullAndPreviewBuildsApart(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, 'GaiaSource_000.csv'), 'w') as csv_file:
+                csv_file.write(CONVERT_CSV)
+            for preview in [[], ['--preview', '1.0']]:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    galaxy.main(['convert', '--input', directory, '--output', directory] + preview)
+
+            for preview, image in [([], 'render-sky.png'), (['--preview'], 'render-sky.preview.png')]:
+                with contextlib.redirect_stdout(io.StringIO()) as output:
+                    galaxy.main(['render', '--input', directory, '--size', '16x8'] + preview)
+                self.assertEqual(output.getvalue().strip(), "2 stars rendered to " + os.path.join(directory, image))
+
+    def test_calculateRGBArrayMatchesSampledColours(self):
+        rgb_data = np.loadtxt(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'util', 'get_rgb_data.csv'),
+                              delimiter=',', skiprows=1)
+        rgb = galaxy.calculate_rgb_array(rgb_data[:, 0])
+        self.assertEqual(rgb.shape, (3, len(rgb_data)))
+        self.assertLess(np.abs(rgb.T - rgb_data[:, 1:]).max(), 1)
+
+        self.assertEqual(galaxy.calculate_rgb(0), [255, 0, 0])
+        self.assertRaises(Exception, galaxy.calculate_rgb, 15001)
+
+    def test_photometricTemperatures(self):
+        bp_rp = np.array([0.82, 0.76, -1.0, 9.0, 0.82])
+        teff_gspphot = np.array([np.nan, np.nan, np.nan, np.nan, 4321.0])
+        self.assertEqual(galaxy.calculate_temperature_array(bp_rp, teff_gspphot).tolist(),
+                         [5770.0, 5960.0, 31500.0, 2400.0, 4321.0])
+        self.assertRaises(Exception, galaxy.read_photometry, {'bp_rp': '', 'teff_gspphot': '5000'}, 'bp_rp')
+        self.assertEqual(galaxy.read_photometry({'bp_rp': '', 'teff_gspphot': '5000'}, 'gspphot')[1], 5000.0)
+
+        t = np.array([0.0, 149.9, 150.0, 5849.0, 15000.0])
+        self.assertEqual(galaxy.retrieve_rgb_array(t).T.tolist(), [galaxy.retrieve_rgb(value) for value in t])
+
 
 
 
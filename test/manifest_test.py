@@ -0,0 +1,69 @@
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+import manifest
+
+GAIA_FILES = [('GaiaSource_%03d.csv' % i, size) for i, size in enumerate([900, 100, 500, 400, 300, 300, 200, 100])]
+
+def converted_entry(gaia_file, points):
+    return {'output': gaia_file + '.las', 'rows': points + 1, 'points': points, 'rejected': {'no parallax': 1},
+            'bounds': [[-points, 0, 0], [points, 1, 1]]}
+
+class TestManifest(unittest.TestCase):
+
+    def test_assignShardsIsBalancedAndComplete(self):
+        shards = manifest.assign_shards(GAIA_FILES, 3)
+        self.assertEqual(shards, manifest.assign_shards(list(reversed(GAIA_FILES)), 3))
+        self.assertEqual(sorted(sum(shards, [])), [gaia_file for gaia_file, size in GAIA_FILES])
+
+        sizes = dict(GAIA_FILES)
+        shard_bytes = [sum(sizes[gaia_file] for gaia_file in shard) for shard in shards]
+        self.assertLessEqual(max(shard_bytes) - min(shard_bytes), 100)
+
+    def test_parseShard(self):
+        self.assertEqual(manifest.parse_shard('2/4'), (2, 4))
+        self.assertRaises(ValueError, manifest.parse_shard, '4/4')
+        self.assertRaises(ValueError, manifest.parse_shard, 'two')
+
+    def test_mergeManifestsChecksCompleteness(self):
+        with tempfile.TemporaryDirectory() as directory:
+            shards = manifest.assign_shards(GAIA_FILES, 2)
+            for index, assigned in enumerate(shards):
+                files = {}
+                for gaia_file in assigned:
+                    files[gaia_file] = converted_entry(gaia_file, 10)
+                    open(os.path.join(directory, gaia_file + '.las'), 'w').close()
+                if index == 0:
+                    self.assertEqual(manifest.merge_manifests(directory), ["no shard manifests found in " + directory])
+                manifest.write_shard_manifest(directory, (index, 2), GAIA_FILES, assigned, {}, files)
+                if index == 0:
+                    self.assertEqual(manifest.merge_manifests(directory), ["shard 1/2 has no manifest"])
+
+            self.assertEqual(manifest.merge_manifests(directory), [])
+            merged = manifest.combine_entries(converted_entry(gaia_file, 10) for gaia_file, size in GAIA_FILES)
+            self.assertEqual(merged['points'], 80)
+            self.assertEqual(merged['rejected'], {'no parallax': 8})
+            self.assertEqual(merged['bounds'], [[-10, 0, 0], [10, 1, 1]])
+
+            #a preview build in the same directory keeps its own manifests and is merged on its own
+            preview_files = {gaia_file: dict(converted_entry(gaia_file, 1), output = gaia_file + '.preview.las') for gaia_file, size in GAIA_FILES}
+            for gaia_file in preview_files:
+                open(os.path.join(directory, gaia_file + '.preview.las'), 'w').close()
+            manifest.write_shard_manifest(directory, (0, 1), GAIA_FILES, sorted(preview_files), {'preview': 0.1}, preview_files,
+                                          suffix = manifest.PREVIEW_SUFFIX)
+            self.assertEqual(manifest.merge_manifests(directory), [])
+            self.assertEqual(manifest.merge_manifests(directory, manifest.PREVIEW_SUFFIX), [])
+            for suffix, points in [('', 80), (manifest.PREVIEW_SUFFIX, 8)]:
+                with open(os.path.join(directory, manifest.MERGED_MANIFEST_NAME.format(suffix = suffix))) as manifest_file:
+                    self.assertEqual(json.load(manifest_file)['totals']['points'], points)
+
+            os.remove(os.path.join(directory, shards[1][0] + '.las'))
+            self.assertEqual(manifest.merge_manifests(directory), [shards[1][0] + " output " + shards[1][0] + ".las is missing"])
+
+
+if __name__ == '__main__':
+    unittest.main()
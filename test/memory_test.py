@@ -0,0 +1,55 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+import memory
+
+MIB = 1 << 20
+
+class TestMemory(unittest.TestCase):
+
+    def test_parseSize(self):
+        self.assertEqual(memory.parse_size('4G'), 4 << 30)
+        self.assertEqual(memory.parse_size('1.5gb'), 3 << 29)
+        self.assertEqual(memory.parse_size('1000'), 1000)
+        self.assertRaises(ValueError, memory.parse_size, 'lots')
+        self.assertRaises(ValueError, memory.parse_size, '0M')
+
+    def test_planFitsBudget(self):
+        #100 MiB per worker besides batches and 1 KiB per row
+        batch_size, workers, limit = memory.plan(1200 * MIB, 50 * MIB, 100 * MIB, 1024, 100000, 4)
+        self.assertEqual((batch_size, workers), (100000, 4))
+        self.assertLessEqual(50 * MIB + workers * (50 * MIB + 100 * MIB + batch_size * 1024), 1200 * MIB)
+
+        #a smaller budget first shrinks batches then drops workers
+        batch_size, workers, limit = memory.plan(1000 * MIB, 50 * MIB, 100 * MIB, 1024, 100000, 4)
+        self.assertEqual((batch_size, workers), ((950 * MIB // 4 - 150 * MIB) // 1024, 4))
+        batch_size, workers, limit = memory.plan(400 * MIB, 50 * MIB, 100 * MIB, 1024, 100000, 4)
+        self.assertEqual(workers, 2)
+        self.assertEqual(batch_size, (175 * MIB - 150 * MIB) // 1024)
+        batch_size, workers, limit = memory.plan(200 * MIB, 50 * MIB, 100 * MIB, 1024, 100000, 4)
+        self.assertEqual((batch_size, workers, limit), (51200, 1, 200 * MIB))
+        self.assertRaises(ValueError, memory.plan, 150 * MIB, 50 * MIB, 100 * MIB, 1024, 100000, 4)
+
+    @unittest.skipIf(memory.rss_bytes() is None, "resident memory is not available")
+    def test_governorShrinksBatches(self):
+        governor = memory.MemoryGovernor(None, 64000)
+        self.assertEqual(governor.check(), 64000)
+
+        governor = memory.MemoryGovernor(1, 64000)
+        self.assertEqual(governor.check(), 32000)
+        for _ in range(10):
+            governor.check()
+        self.assertEqual(governor.batch_size, memory.MINIMUM_BATCH_SIZE)
+        self.assertEqual(governor.shrinks, 6)
+
+        #batches grow back to the planned size once resident memory is well below the limit
+        governor.limit = 1 << 60
+        self.assertEqual(governor.check(), 2 * memory.MINIMUM_BATCH_SIZE)
+        for _ in range(10):
+            governor.check()
+        self.assertEqual((governor.batch_size, governor.shrinks), (64000, 6))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import os
+import sys
+import tempfile
+import unittest
+import zlib
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+import render
+from writers_test import sample_columns
+
+class TestRender(unittest.TestCase):
+
+    def test_mergedBuffersMatchOneBuffer(self):
+        batches = [sample_columns(1000, 1), sample_columns(0, 2), sample_columns(500, 3)]
+        for projection in render.PROJECTIONS:
+            whole = render.RenderBuffer(projection, 64, 32, extent = 8.0)
+            parts = [render.RenderBuffer(projection, 64, 32, extent = 8.0) for batch in batches]
+            for part, batch in zip(parts, batches):
+                whole.add(batch)
+                part.add(batch)
+            for part in parts[1:]:
+                parts[0].merge(part)
+
+            self.assertTrue(np.array_equal(whole.counts, parts[0].counts))
+            self.assertTrue(np.allclose(whole.colour_sums, parts[0].colour_sums))
+            self.assertRaises(ValueError, whole.merge, render.RenderBuffer(projection, 32, 32, extent = 8.0))
+
+        #the face-on view drops stars beyond its extent
+        self.assertEqual(whole.projection, 'faceon')
+        self.assertLess(whole.counts.sum(), 1500)
+        #the north pole, the south pole and the centre of the sky map
+        sky = render.RenderBuffer('sky', 64, 32)
+        sky.add({'x': np.array([0.0, 0.0, 1.0]), 'y': np.array([0.0, 0.0, 0.0]), 'z': np.array([1.0, -1.0, 0.0]),
+                 'red': np.full(3, 255.0), 'green': np.zeros(3), 'blue': np.zeros(3)})
+        self.assertEqual(np.flatnonzero(sky.counts).tolist(), [32, 16 * 64 + 32, 31 * 64 + 32])
+
+    def test_writeImages(self):
+        buffer = render.RenderBuffer('sky', 16, 8)
+        buffer.add(sample_columns(200, 4))
+        with tempfile.TemporaryDirectory() as directory:
+            buffer.save(os.path.join(directory, 'buffer.npz'))
+            loaded = render.RenderBuffer.load(os.path.join(directory, 'buffer.npz'))
+            self.assertTrue(np.array_equal(loaded.counts, buffer.counts))
+
+            buffer.write_image(os.path.join(directory, 'sky.png'))
+            with open(os.path.join(directory, 'sky.png'), 'rb') as png_file:
+                png = png_file.read()
+            idat = png.index(b'IDAT')
+            length = int.from_bytes(png[idat - 4:idat], 'big')
+            rows = np.frombuffer(zlib.decompress(png[idat + 4:idat + 4 + length]), dtype = np.uint8).reshape(8, 1 + 16 * 3)
+            self.assertTrue(np.array_equal(rows[:, 1:].reshape(8, 16, 3), buffer.image()))
+
+            buffer.write_image(os.path.join(directory, 'sky.fits'))
+            with open(os.path.join(directory, 'sky.fits'), 'rb') as fits_file:
+                fits = fits_file.read()
+            self.assertEqual(len(fits), 2880 + 2880)
+            counts = np.frombuffer(fits[2880:2880 + 16 * 8 * 4], dtype = '>f4').reshape(8, 16)
+            self.assertTrue(np.array_equal(counts[::-1], buffer.counts.reshape(8, 16)))
+
+    def test_mergeBuffersNeedsEveryShardOfOneBuild(self):
+        with tempfile.TemporaryDirectory() as directory:
+            self.assertIsNone(render.merge_buffers(directory, 'sky'))
+
+            buffers = [render.RenderBuffer('sky', 16, 8) for index in range(3)]
+            for index, buffer in enumerate(buffers):
+                buffer.add(sample_columns(100, index))
+                buffer.save(os.path.join(directory, render.BUFFER_NAME.format(projection = 'sky', index = index, count = 3, suffix = '')))
+            merged = render.merge_buffers(directory, 'sky')
+            self.assertEqual(merged.counts.sum(), 300)
+
+            #the buffer of a preview build in the same directory is merged on its own
+            buffers[0].save(os.path.join(directory, render.BUFFER_NAME.format(projection = 'sky', index = 0, count = 1, suffix = '.preview')))
+            self.assertEqual(render.merge_buffers(directory, 'sky').counts.sum(), 300)
+            self.assertEqual(render.merge_buffers(directory, 'sky', '.preview').counts.sum(), 100)
+
+            #a stale buffer of a build with another number of shards
+            buffers[0].save(os.path.join(directory, render.BUFFER_NAME.format(projection = 'sky', index = 1, count = 2, suffix = '')))
+            self.assertRaises(ValueError, render.merge_buffers, directory, 'sky')
+            os.remove(os.path.join(directory, render.BUFFER_NAME.format(projection = 'sky', index = 1, count = 2, suffix = '')))
+
+            os.remove(os.path.join(directory, render.BUFFER_NAME.format(projection = 'sky', index = 2, count = 3, suffix = '')))
+            with self.assertRaisesRegex(ValueError, 'shard 2/3 has no buffer'):
+                render.merge_buffers(directory, 'sky')
+
+if __name__ == '__main__':
+    unittest.main()
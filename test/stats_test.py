@@ -0,0 +1,63 @@
+import json
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+import stats
+import writers_test
+
+#columns of writers_test with heavy tailed coordinates and temperatures, some of them missing
+def sample_columns(count, seed):
+    columns = writers_test.sample_columns(count, seed)
+    random = np.random.default_rng((seed, 1))
+    for name in ['x', 'y', 'z']:
+        columns[name] = random.standard_cauchy(count)
+    columns['temperature'] = random.lognormal(8.5, 0.3, count)
+    columns['temperature'][::10] = np.nan
+
+    return columns
+
+class TestStats(unittest.TestCase):
+
+    def test_mergedStatisticsMatchWholeColumns(self):
+        batches = [sample_columns(count, seed) for seed, count in enumerate([20000, 0, 1, 50000, 30000])]
+        workers = [stats.BatchStatistics() for _ in range(2)]
+        for index, batch in enumerate(batches):
+            workers[index % 2].add(batch)
+        #statistics are merged after a round trip through json as they are between shards
+        merged = stats.BatchStatistics.from_dict(json.loads(json.dumps(stats.combine_statistics([worker.to_dict() for worker in workers]))))
+
+        temperature = np.concatenate([batch['temperature'] for batch in batches])
+        missing = np.isnan(temperature)
+        temperature = temperature[~missing]
+        summary = merged.columns['temperature']
+        self.assertEqual((summary.count, summary.missing), (len(temperature), np.count_nonzero(missing)))
+        self.assertEqual((summary.minimum, summary.maximum), (temperature.min(), temperature.max()))
+        self.assertAlmostEqual(summary.mean, temperature.mean(), places = 6)
+        self.assertAlmostEqual(summary.variance() / temperature.var(ddof = 1), 1.0, places = 9)
+        self.assertEqual(summary.histogram.tolist(), np.histogram(temperature, bins = 200, range = (0.0, 40000.0))[0].tolist())
+
+        #quantiles are within a small error in rank, down to the tails of heavy tailed columns
+        x = np.sort(np.concatenate([batch['x'] for batch in batches]))
+        summary = merged.columns['x']
+        self.assertEqual(summary.below + summary.above + summary.histogram.sum(), len(x))
+        self.assertLessEqual(len(summary.sketch.means), stats.SKETCH_COMPRESSION / 2 + 1)
+        for q in stats.REPORTED_QUANTILES:
+            rank = np.searchsorted(x, summary.sketch.quantile(q)) / len(x)
+            self.assertLess(abs(rank - q), 0.002 + 0.01 * q * (1 - q))
+
+        distance = np.concatenate([np.sqrt(batch['x'] ** 2 + batch['y'] ** 2 + batch['z'] ** 2) for batch in batches])
+        self.assertEqual(merged.columns['distance'].maximum, distance.max())
+
+    def test_emptyStatistics(self):
+        statistics = stats.BatchStatistics()
+        statistics.add(sample_columns(0, 1))
+        summary = statistics.to_dict()['x']
+        self.assertEqual((summary['count'], summary['min'], summary['quantiles']), (0, None, {}))
+        self.assertIsNone(stats.combine_statistics([]))
+
+if __name__ == '__main__':
+    unittest.main()
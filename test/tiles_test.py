@@ -0,0 +1,57 @@
+import os
+import sys
+import tempfile
+import unittest
+
+import laspy
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+import tiles
+import writers_test
+
+#columns of writers_test with the source ids of real stars, which are below 12 * 4 ** 12 level 12 pixels
+def sample_columns(count, seed):
+    columns = writers_test.sample_columns(count, seed)
+    columns['source_id'] = np.random.default_rng((seed, 1)).integers(0, 12 * 4 ** 12 << 35, count, dtype = np.uint64)
+
+    return columns
+
+class TestTiles(unittest.TestCase):
+
+    def test_healpixPixels(self):
+        source_id = (125 << 35) + 12345
+        self.assertEqual(tiles.healpix_pixels([source_id], 12)[0], 125)
+        self.assertEqual(tiles.healpix_pixels([source_id], 11)[0], 125 // 4)
+        self.assertEqual(tiles.healpix_pixels([(12 * 4 ** 12 << 35) - 1], 0)[0], 11)
+        self.assertEqual(tiles.source_id_range(3, 1), (3 << 57, (4 << 57) - 1))
+        self.assertRaises(ValueError, tiles.healpix_pixels, [0], 13)
+
+    def test_tilePoolWritesEveryPointToItsTile(self):
+        batches = [sample_columns(300, 1), sample_columns(0, 2), sample_columns(200, 3)]
+        with tempfile.TemporaryDirectory() as directory:
+            #a single open file forces tiles to be closed and reopened in append mode
+            pool = tiles.TileWriterPool(directory, 1, max_open_files = 1)
+            tile_writer = tiles.TileFileWriter(pool)
+            for batch in batches:
+                tile_writer.write(batch)
+            point_count, bounds = tile_writer.close()
+            index = pool.close()
+
+            self.assertEqual(point_count, 500)
+            self.assertEqual(dict(tile_writer.tiles), {tile_file: tile['points'] for tile_file, tile in index.items()})
+            self.assertEqual(sorted(os.listdir(directory)), sorted(index))
+
+            source_ids = []
+            for tile_file, tile in index.items():
+                tile_data = laspy.read(os.path.join(directory, tile_file))
+                self.assertEqual(tile_data.header.point_count, tile['points'])
+                self.assertTrue(np.all(tiles.healpix_pixels(tile_data.source_id, 1) == tile['pixel']))
+                self.assertTrue(np.allclose(tile_data.header.mins, tile['bounds'][0]))
+                source_ids.append(np.asarray(tile_data.source_id))
+
+            expected = np.concatenate([batch['source_id'] for batch in batches])
+            self.assertTrue(np.array_equal(np.sort(np.concatenate(source_ids)), np.sort(expected)))
+
+if __name__ == '__main__':
+    unittest.main()
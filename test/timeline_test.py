@@ -0,0 +1,115 @@
+import csv
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+from astropy import units as u
+from astropy.cosmology import Planck15
+from scipy.integrate import quad
+from scipy.optimize import brentq
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'util'))
+import timeline
+
+#redshift above which the universe is radiation dominated and its age is 1/(2H)
+RADIATION_REDSHIFT = 1e13
+
+#hubble time 1/H in seconds at log(1+z)
+def hubble_time(lnzp1):
+    return 1 / (Planck15.H0.to(1 / u.s).value * Planck15.efunc(np.expm1(lnzp1)))
+
+#age at a redshift in seconds integrated with quad, astropy's cosmo.age is only good to about 5e-7 at recombination and
+#is far off above a redshift of about 1e4
+def reference_age(z):
+    top = np.log1p(RADIATION_REDSHIFT)
+
+    return quad(hubble_time, np.log1p(z), top, epsabs = 0, epsrel = 1e-13, limit = 1000)[0] + hubble_time(top) / 2
+
+#redshift at a time in seconds found by root finding on the age, with the scale factor growing as sqrt(t) before
+#radiation-matter equality, as uniProp did before the tables of CosmoContext
+def reference_redshift(t, a_eq):
+    t_eq = reference_age(1 / a_eq - 1)
+    if t <= t_eq:
+        return 1 / (a_eq * np.sqrt(t / t_eq)) - 1
+
+    return np.expm1(brentq(lambda lnzp1: np.log(reference_age(np.expm1(lnzp1)) / t), 0, -np.log(a_eq), xtol = 1e-14))
+
+#particle horizon in Mpc at a redshift, from the conformal time integrated from the big bang to the age of the redshift
+def reference_horizon(z, a_eq):
+    t_eq = reference_age(1 / a_eq - 1)
+    age = reference_age(z)
+    if age <= t_eq:
+        eta = 2 * np.sqrt(age * t_eq) / a_eq
+    else:
+        integrand = lambda lnzp1: np.exp(lnzp1) * hubble_time(lnzp1)
+        eta = 2 * t_eq / a_eq + quad(integrand, np.log1p(z), -np.log(a_eq), epsabs = 0, epsrel = 1e-13, limit = 1000)[0]
+
+    return (timeline.cc.c * eta * u.s / (1 + z)).to(u.Mpc).value
+
+class TestTimeline(unittest.TestCase):
+
+    def test_contextMatchesRootFindingAndIntegration(self):
+        a_eq = timeline.cosmoContext(Planck15).a_eq
+        #photon epoch, recombination and today
+        times = np.array([1e3, 3.8e5, Planck15.age(0).to(u.yr).value]) * u.yr
+        props = timeline.uniProp_batch(times, cosmo = Planck15)
+
+        for t, z, d_hor in zip(times.to(u.s).value, props['z'], props['d_hor'].to(u.Mpc).value):
+            z_reference = reference_redshift(t, a_eq)
+            self.assertLess(abs(z - z_reference), 1e-7 * (1 + z_reference))
+            horizon = reference_horizon(z_reference, a_eq)
+            self.assertLess(abs(timeline.dP(z_reference, Planck15).to(u.Mpc).value / horizon - 1), 1e-8)
+            self.assertLess(abs(d_hor / horizon - 1), 1e-8)
+
+    def test_batchTimesFromFile(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'times.txt')
+            with open(path, 'w') as time_file:
+                time_file.write('# epochs\n1 s\n\n   \n  380 kyr  \n#13 Gyr\n1 Gyr\n')
+            times = timeline.batchTimes(['1 yr', '100 yr', '3'], path, log = True)
+
+        self.assertEqual(times.unit, u.s)
+        expected = np.r_[(np.array([1, 10, 100]) * u.yr).to(u.s).value, 1, (np.array([380e3, 1e9]) * u.yr).to(u.s).value]
+        np.testing.assert_allclose(times.value, expected, rtol = 1e-12)
+
+    def test_tableKeepsOrderAcrossProcesses(self):
+        times = np.geomspace(1e-30, 1e17, 40)[::-1] * u.s
+        serial = timeline.timelineTable(times, cosmo = Planck15, nproc = 1)
+        parallel = timeline.timelineTable(times, cosmo = Planck15, nproc = 2)
+
+        self.assertEqual(serial.keys(), parallel.keys())
+        for key, values in serial.items():
+            if isinstance(values, u.Quantity):
+                np.testing.assert_array_equal(parallel[key].to(values.unit).value, values.value)
+            else:
+                np.testing.assert_array_equal(parallel[key], values)
+
+    def test_tableRoundTrip(self):
+        props = timeline.uniProp_batch(np.geomspace(1, 1e10, 7) * u.yr, cosmo = Planck15)
+        with tempfile.TemporaryDirectory() as directory:
+            timeline.writeTable(props, os.path.join(directory, 'table.csv'))
+            timeline.writeTable(props, os.path.join(directory, 'table.json'))
+            with open(os.path.join(directory, 'table.csv'), newline = '') as csv_file:
+                csv_rows = list(csv.DictReader(csv_file))
+            with open(os.path.join(directory, 'table.json')) as json_file:
+                json_rows = json.load(json_file)
+
+        self.assertEqual([name for name, _, _ in timeline.TABLE_COLUMNS], list(csv_rows[0].keys()))
+        self.assertEqual(len(csv_rows), 7)
+        self.assertEqual(len(json_rows), 7)
+        for name, key, unit in timeline.TABLE_COLUMNS:
+            if isinstance(unit, int):
+                expected = props[key][:, unit].tolist()
+            elif unit is None:
+                expected = np.asarray(props[key]).tolist()
+            else:
+                expected = props[key].to(unit).value.tolist()
+            self.assertEqual([row[name] for row in json_rows], expected)
+            self.assertEqual([row[name] for row in csv_rows], [str(value) for value in expected])
+        self.assertRaises(ValueError, timeline.writeTable, props, 'table.txt')
+
+if __name__ == '__main__':
+    unittest.main()
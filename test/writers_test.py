@@ -0,0 +1,92 @@
+import os
+import sys
+import tempfile
+import unittest
+
+import laspy
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+import writers
+
+def sample_columns(count, seed):
+    random = np.random.default_rng(seed)
+    columns = {name: random.uniform(-20, 20, count) for name in ['x', 'y', 'z']}
+    for name in ['red', 'green', 'blue']:
+        columns[name] = random.uniform(0, 255, count)
+    for name, type in writers.EXTRA_DIMENSIONS:
+        columns[name] = random.integers(0, 2 ** 63, count, dtype = np.uint64)
+
+    return columns
+
+class TestWriters(unittest.TestCase):
+
+    def test_memmapWriterMatchesLasDataWriter(self):
+        batches = [sample_columns(100, 1), sample_columns(0, 2), sample_columns(57, 3)]
+        with tempfile.TemporaryDirectory() as directory:
+            summaries = {}
+            for name, writer_class in writers.WRITERS.items():
+                writer = writer_class(os.path.join(directory, name + '.las'), 200)
+                for batch in batches:
+                    writer.write(batch)
+                summaries[name] = writer.close()
+
+            lasdata = laspy.read(os.path.join(directory, 'lasdata.las'))
+            memmap = laspy.read(os.path.join(directory, 'memmap.las'))
+            self.assertEqual(memmap.header.point_count, 157)
+            self.assertTrue(np.array_equal(lasdata.points.array, memmap.points.array))
+            self.assertEqual(summaries['lasdata'], summaries['memmap'])
+            self.assertEqual(os.path.getsize(os.path.join(directory, 'memmap.las')),
+                             memmap.header.offset_to_point_data + 157 * memmap.header.point_format.size)
+
+    def test_attributesAreScaledIntoCompactDimensions(self):
+        columns = sample_columns(4, 1)
+        columns['temperature'] = np.array([3456.0, 5000.0, np.nan, 1e6])
+        columns['magnitude'] = np.array([12.34, -5.0, 21.0, np.nan])
+        columns['intensity'] = columns['magnitude']
+        columns['distance'] = np.array([0.5, 65.534, 65.535, np.nan])
+        attributes = ['temperature', 'magnitude', 'intensity', 'distance']
+
+        with tempfile.TemporaryDirectory() as directory:
+            for name, writer_class in writers.WRITERS.items():
+                writer = writer_class(os.path.join(directory, name + '.las'), 4, attributes, {'temperature': 'bp_rp'})
+                writer.write(columns)
+                writer.close()
+
+                galaxy_data = laspy.read(os.path.join(directory, name + '.las'))
+                self.assertEqual(writers.read_settings(galaxy_data.header), {'temperature': 'bp_rp'})
+                self.assertEqual(galaxy_data.points.array['temperature'].dtype, np.uint16)
+                #values beyond the range of a type are missing data rather than saturated
+                self.assertEqual(list(galaxy_data.points.array['temperature']), [346, 500, 65535, 65535])
+                self.assertEqual(list(galaxy_data.points.array['magnitude']), [143, 255, 230, 255])
+                self.assertEqual(list(np.round(np.array(galaxy_data.magnitude)[[0, 2]], 1)), [12.3, 21.0])
+                self.assertEqual(list(galaxy_data.points.array['distance']), [500, 65534, 65535, 65535])
+                self.assertEqual(list(galaxy_data.intensity), [25224, 65535, 0, 0])
+
+    def test_coordinatesMatchLaspyScaling(self):
+        columns = sample_columns(1000, 4)
+        columns['x'][:4] = [writers.COORDINATE_LIMIT, -writers.COORDINATE_LIMIT, 0.005, 0.015]
+        header = writers.create_header()
+        points = laspy.ScaleAwarePointRecord.zeros(1000, header = header)
+        writers.fill_records(points.array, header, columns, [])
+
+        galaxy_data = laspy.LasData(header, points = laspy.ScaleAwarePointRecord.zeros(1000, header = header))
+        galaxy_data.x, galaxy_data.y, galaxy_data.z = columns['x'], columns['y'], columns['z']
+        for name in ['X', 'Y', 'Z']:
+            self.assertTrue(np.array_equal(points.array[name], galaxy_data.points.array[name]))
+
+        #coordinates that do not fit are refused as laspy refuses them instead of wrapping around
+        columns['x'][0] = 1e8
+        self.assertRaises(OverflowError, writers.fill_records, points.array, header, columns, [])
+        with self.assertRaises(OverflowError):
+            galaxy_data.x = columns['x']
+
+    def test_memmapWriterRejectsMorePointsThanPreallocated(self):
+        with tempfile.TemporaryDirectory() as directory:
+            writer = writers.MemmapLasWriter(os.path.join(directory, 'memmap.las'), 10)
+            self.assertRaises(Exception, writer.write, sample_columns(11, 1))
+            self.assertEqual(writer.close(), (0, None))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import argparse
+import csv
+import glob
+import os
+import numpy
+
+#read bp_rp and teff_gspphot of every star that has both from GaiaSource csv files, reading at most limit rows of each
+def read_photometry(paths, limit):
+    bp_rp, teff = [], []
+    for path in paths:
+        with open(path, newline = '') as csv_file:
+            for i, row in enumerate(csv.DictReader(csv_file)):
+                if limit is not None and i >= limit:
+                    break
+                if row['bp_rp'] != '' and row['teff_gspphot'] != '':
+                    bp_rp.append(float(row['bp_rp']))
+                    teff.append(float(row['teff_gspphot']))
+
+    return numpy.array(bp_rp), numpy.array(teff)
+
+#fit a table of bp_rp colour to temperature from the median colour and temperature of the stars in bins of colour with
+#at least min_stars stars, temperatures are made to fall as the colour gets redder so the table can be interpolated
+def fit_table(bp_rp, teff, width, min_stars):
+    edges = numpy.arange(numpy.floor(bp_rp.min() / width) * width, bp_rp.max() + width, width)
+    bins = numpy.digitize(bp_rp, edges)
+
+    colours, temperatures = [], []
+    for index in numpy.unique(bins):
+        in_bin = bins == index
+        if numpy.count_nonzero(in_bin) >= min_stars:
+            colours.append(numpy.median(bp_rp[in_bin]))
+            temperatures.append(numpy.median(teff[in_bin]))
+
+    return numpy.array(colours), numpy.minimum.accumulate(numpy.array(temperatures))
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Fit the bp_rp to temperature table BP_RP_TEMPERATURES in galaxy.py from teff_gspphot')
+    parser.add_argument('-input', default = '.',  type = str,   help = 'Directory of GaiaSource csv files. Default is the current directory')
+    parser.add_argument('-width', default = 0.1,  type = float, help = 'Width of the bp_rp bins. Default is 0.1')
+    parser.add_argument('-min',   default = 100,  type = int,   help = 'Fewest stars in a bin for it to be used. Default is 100')
+    parser.add_argument('-limit', default = None, type = int,   help = 'Read at most this many rows of each file')
+    args = parser.parse_args()
+
+    bp_rp, teff = read_photometry(sorted(glob.glob(os.path.join(args.input, '*.csv'))), args.limit)
+    if len(bp_rp) == 0:
+        parser.error('no stars with both bp_rp and teff_gspphot found in ' + args.input)
+    colours, temperatures = fit_table(bp_rp, teff, args.width, args.min)
+
+    print('#' + str(len(bp_rp)) + ' stars, ' + str(len(colours)) + ' bins')
+    print('BP_RP_TEMPERATURES = [')
+    for colour, temperature in zip(colours, temperatures):
+        print('    (' + format(colour, '.2f') + ', ' + format(round(temperature, -1), '.1f') + '),')
+    print('    ]')
+
+if __name__ == '__main__':
+    main()
@@ -1,43 +1,99 @@
-import numpy
-import timeline
-import matplotlib
+import argparse
 import csv
+import numpy
+import blackbody
+
+#sample the exact rgb colour of a blackbody from blackbody.rgb_from_T at every step kelvin from 0 up to t_max
+def sample_rgb(t_max, step):
+    temperatures = numpy.arange(0, t_max + step, step, dtype = float)
+    rgb_values = numpy.array([blackbody.rgb_from_T(temperature, False, 255, False) for temperature in temperatures])
+
+    return temperatures, rgb_values
+
+#split the samples of one channel into segments, runs of samples that are exactly 0 or 255 become constant segments and
+#everything in between becomes a segment to be fitted with a polynomial, each segment is returned as the pair of sample
+#indices it covers, fitted segments also take in the neighbouring samples so that they meet the constant segments
+def find_segments(values):
+    constant = numpy.where(values >= 255, 255.0, numpy.where(values <= 0, 0.0, numpy.nan))
+    changes = numpy.flatnonzero(~((constant[1:] == constant[:-1]) | numpy.isnan(constant[1:]) & numpy.isnan(constant[:-1]))) + 1
+    starts = [0] + changes.tolist()
+    ends = changes.tolist() + [len(values)]
+
+    segments = []
+    for start, end in zip(starts, ends):
+        if numpy.isnan(constant[start]):
+            segments.append((max(start - 1, 0), min(end, len(values) - 1)))
+        else:
+            segments.append((start, end - 1))
+
+    return segments
+
+#fit a polynomial of the given degree to the samples between the indices of a segment with least squares, the
+#polynomial is fitted to the temperature mapped from [lower, upper] to [-1, 1] to keep it well conditioned, if the
+#maximum error is above the tolerance the segment is bisected and both halves are fitted again
+def fit_segment(temperatures, values, first, last, degree, tolerance):
+    lower, upper = temperatures[first], temperatures[last]
+    segment_values = values[first:last + 1]
+
+    if numpy.all(segment_values == segment_values[0]) and segment_values[0] in (0, 255):
+        return [(lower, upper, [float(segment_values[0])])], 0.0
+
+    polynomial = numpy.polynomial.Polynomial.fit(temperatures[first:last + 1], segment_values, min(degree, last - first),
+                                                 domain = [lower, upper], window = [-1, 1])
+    error = numpy.max(numpy.abs(polynomial(temperatures[first:last + 1]) - segment_values))
+
+    if tolerance is not None and error > tolerance and last - first > 2 * (degree + 1):
+        middle = (first + last) // 2
+        lower_segments, lower_error = fit_segment(temperatures, values, first, middle, degree, tolerance)
+        upper_segments, upper_error = fit_segment(temperatures, values, middle, last, degree, tolerance)
+        return lower_segments + upper_segments, max(lower_error, upper_error)
+
+    return [(lower, upper, polynomial.coef.tolist())], error
+
+#fit every channel and return its segments along with the maximum error of each channel
+def fit_rgb(temperatures, rgb_values, degree, tolerance):
+    rgb_segments, errors = [], []
+    for channel in range(3):
+        channel_segments, channel_error = [], 0.0
+        for first, last in find_segments(rgb_values[:, channel]):
+            segments, error = fit_segment(temperatures, rgb_values[:, channel], first, last, degree, tolerance)
+            channel_segments += segments
+            channel_error = max(channel_error, error)
+        rgb_segments.append(channel_segments)
+        errors.append(channel_error)
+
+    return rgb_segments, errors
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Fit piecewise polynomials to the rgb colour of a blackbody for RGB_SEGMENTS in galaxy.py')
+    parser.add_argument('-tmax',      default = 15000, type = float, help = 'Highest temperature in K. Default is 15000')
+    parser.add_argument('-step',      default = 5,     type = float, help = 'Sampling step in K. Default is 5')
+    parser.add_argument('-degree',    default = 4,     type = int,   help = 'Degree of the polynomials. Default is 4')
+    parser.add_argument('-tolerance', default = None,  type = float, help = 'Bisect segments until the maximum error is below this value')
+    parser.add_argument('-csv',       default = '',    type = str,   help = 'Also write the sampled colours to this csv file')
+    args = parser.parse_args()
+
+    temperatures, rgb_values = sample_rgb(args.tmax, args.step)
+
+    if args.csv != '':
+        with open(args.csv, 'w', newline = '') as csv_file:
+            writer = csv.writer(csv_file, lineterminator = '\n')
+            writer.writerow(['temperature', 'red', 'green', 'blue'])
+            for temperature, rgb_value in zip(temperatures, rgb_values):
+                writer.writerow([format(temperature, 'g')] + [format(value, '.10g') for value in rgb_value])
+
+    rgb_segments, errors = fit_rgb(temperatures, rgb_values, args.degree, args.tolerance)
+
+    for name, channel_segments, error in zip(['red', 'green', 'blue'], rgb_segments, errors):
+        print('#' + name + ': ' + str(len(channel_segments)) + ' segments, maximum error ' + format(error, '.3f'))
+
+    print('RGB_SEGMENTS = [')
+    for channel_segments in rgb_segments:
+        print('    [')
+        for lower, upper, coefficients in channel_segments:
+            print('        (' + repr(float(lower)) + ', ' + repr(float(upper)) + ', ' + repr(coefficients) + '),')
+        print('    ],')
+    print('    ]')
 
-temperatures = range(0, 15001, 100)
-temperature_values, red_values, green_values, blue_values = [], [], [], []
-for temperature in temperatures:
-
-    red_value, green_value, blue_value = timeline.rgb_from_T(temperature, False, 255, False)
-
-    round(red_value, 2)
-    round(green_value, 2)
-    round(blue_value, 2)
-
-    print(str(temperature) + " : [" + str(red_value) + ", " + str(green_value) + ", " + str(blue_value) + "],")
-
-    temperature_values.append(temperature)
-    red_values.append(red_value)
-    green_values.append(green_value)
-    blue_values.append(blue_value)
-
-#red higher than 5710
-red_high_polynomial = numpy.polynomial.Polynomial.fit(temperature_values[1141:], red_values[1141:], 4)
-#green in between 
-green_lower_polynomial = numpy.polynomial.Polynomial.fit(temperature_values[133:1143], green_values[133:1143], 4)
-#green higher than
-green_higher_polynomial = numpy.polynomial.Polynomial.fit(temperature_values[1229:], green_values[1229:], 4)
-#blue in between
-blue_middle_polynomial = numpy.polynomial.Polynomial.fit(temperature_values[279:1231], blue_values[279:1231], 4) 
-   
-print(red_high_polynomial, green_lower_polynomial, green_higher_polynomial, blue_middle_polynomial)
-
-#produce a matrix of values where each row corresponds to an x value in the data and each column corresponds to a 
-#coefficient in the final formula (the total number of columns is degree + 1)
-def polynomial_best_fit(x, y, degree):
-    matrix = []
-    for x_value in x:
-        row = []
-        for j in range(degree, 0, -1):
-            row.append(x_value ^ j)
-        row.append(int(1))
-        matrix.append(row) 
+if __name__ == '__main__':
+    main()
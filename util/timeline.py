@@ -1,15 +1,16 @@
 import argparse
+import csv
+import json
+import multiprocessing
 import numpy as np
 from numpy import sqrt,pi,exp
-import scipy as sp
 from astropy.cosmology import FlatLambdaCDM,WMAP5,WMAP7,WMAP9,Planck13,Planck15
 from astropy import units as u
 from astropy.units import cds
-import matplotlib.pyplot as plt
 import astropy.constants as cc
 from scipy.special import zeta
 from scipy.optimize import newton
-from scipy.integrate import simps
+from blackbody import planck,rgb_from_T,rgb,xy,cie,adjust_gamma   # Colour helpers, kept in a NumPy-only module
 mycosmo = FlatLambdaCDM(H0       = 67.81,
                         Om0      = 0.308,
                         Ob0      = .0484,
@@ -38,6 +39,7 @@ def uniProp(t,                  #Time with unit
     Usage:
         From the command line:
             > python timeline.py time unit [-Runit my_dist_unit]
+            > python timeline.py -range START STOP NUM [-log] -out table.csv
         From Python environment:
             >>> from astropy import units as u
             >>> import timeline
@@ -63,12 +65,22 @@ def uniProp(t,                  #Time with unit
                              Allowed cosmologies are WMAP5, WMAP7, WMAP9,
                              Planck13, and Planck15 (default)
 
+    Batch mode (writes a table instead of printing a report):
+        -range START STOP NUM  NUM times from START to STOP, which are
+                             quantities like "1e-32 s" or "13.79 Gyr"
+        -log                 Space the -range times logarithmically
+        -file my_times.txt   File with one quantity per line
+        -out my_table.csv    Output table; .csv, .json or .parquet
+        -nproc N             Number of processes (default all cores)
+
     Examples:
         > python timeline.py 1e-32 s            # Properties just after inflation
         > python timeline.py 13.79 Gyr          # Properties today
         > python timeline.py 500 Myr -Runit Gpc # Properties 500 million years after
                                                 # Big Bang, but use Gpc (giga-parsec)
                                                 # for distances
+        > python timeline.py -range "1e-32 s" "13.79 Gyr" 5000 -log -out timeline.csv
+                                                # Table of 5000 epochs
 
     Same examples from Python environment:
         >>> from astropy import units as u
@@ -79,75 +91,34 @@ def uniProp(t,                  #Time with unit
     """
 
 
-    def photonPressure(T):
-        """Photon pressure"""
-        return (pi**2 * cc.k_B**4 / (45 * cc.c**3 * cc.h**3) * T**4)
-
-
-    def nph(T):
-        """Photon number density"""
-        return 16 * pi * (cc.k_B*T / (cc.h*cc.c))**3 * zeta(3)
-
-    # Calculate radiation-matter equality
+    # Calculate radiation-matter and matter-dark energy equality
     assert (isinstance(t,u.Quantity)) and (t.unit.is_equivalent(u.s)), '\n\nKeyword `t` must have units of time.'
-    assert t >= 1e-32*u.s,    '\n\nt must be >= the end of inflation, which is assumed to be at 1e-32 s.'
-    assert t <= cosmo.age(0), "\n\nt must be <= the age of the Universe, which for the chosen cosmology is {:}".format(cosmo.age(0))
-    a_eq = newton(a_eqSolver,3400.,args=(cosmo,))
-    z_eq = 1/a_eq - 1
-    t_eq = cosmo.age(z_eq).to(u.yr) # (4/3. * (1 - 1/sqrt(2)) * (cosmo.Onu0 + cosmo.Ogamma0)**1.5/cosmo.Om0**2 / cosmo.H0).to(u.yr)
-    rho_eq = cosmo.critical_density(z_eq)
-
-    # Calculate matter-dark energy equality
-    a_DE = (cosmo.Om0 / cosmo.Ode0)**.3333333
-    z_DE = 1/a_DE - 1
-    t_DE = cosmo.age(z_DE).to(u.Gyr)
-
-    # Calculate redshift, density, and temperature
-    if t <= t_eq:
-        epoch = 'photon epoch'
-        a   = (a_eq * sqrt(t/t_eq).decompose()).value
-        rho = rho_eq * (a_eq/a)**4
-        z   = 1./a - 1
-        T   = cosmo.Tcmb0 / a
-    else:
-        epoch = 'matter epoch' if t<t_DE else 'dark energy epoch'
-        from astropy.cosmology import z_at_value
-        z   = z_at_value(cosmo.age, t, zmin=0, zmax=5000)
-        a   = cosmo.scale_factor(z)
-        rho = cosmo.critical_density(z)
-        T   = cosmo.Tcmb(z)
-
-    # More properties
-    H    = cosmo.H(z)                       #Hubble parameter
-    R0   = cosmo.comoving_distance(2.7e7)   #Distance in cm to particle horizon today; the 2.7e7 is roughly the highest redshift it can take, but using 1e7, or even 1e6 or 1e4 gives almost the same result
-    d_hor = dP(z,cosmo)                     # Horizon distance at t
-    d_H   = cc.c / H                        # Hubble radius at t
-    Pph  = photonPressure(T)                #Photon pressure
-    R    = a * R0                           #Radius of Universe at end of inflation
-    rhob = cosmo.critical_density0 * cosmo.Ob0 / a**3   #Baryon density at t
-    n_ph = nph(T)                           #Photon number desity 
-    X    = .75                              #Primordial hydrogen mass fraction
-    Y    = 1 - X                            #Primordial helium
-    mu   = 1 / (X + Y/4)                    #Mean molecular mass per ion
-    nbar = rhob / (mu*cc.m_p)               #Number density of baryons
-    Pbar = nbar * cc.k_B * T                #Baryon pressure
-    RGB  = rgb_from_T(T/u.K, ncol=255)      #RGB color code
-    E    = cc.k_B * T                       #Energy per particle
-
-    # Calculate ionization fraction and resulting mean free path of photons
-    if T > 4500*u.K:
-        xe = 1.
-    elif 4500*u.K >= T > 500*u.K:
-        if T > 2500*u.K:
-            x0 = .999
-        elif 2500*u.K >= T > 100*u.K:
-            x0 = .5
-        elif 100*u.K >= T > 50*u.K:
-            x0 = 1e-5
-        xe  = newton(Saha,x0,args=(T.value,cosmo))
-    elif T <= 500*u.K:
-        xe = 1e-10
-    mfp   = meanFreePath(rhob,xe,X)
+    ctx   = cosmoContext(cosmo)
+    z_eq  = ctx.z_eq
+    t_eq  = ctx.t_eq
+    z_DE  = ctx.z_DE
+    t_DE  = ctx.t_DE
+    R0    = ctx.R0
+
+    # Calculate all properties at t
+    props = uniProp_batch(t, cosmo=cosmo)
+    epoch = props['epoch'][0]
+    a     = props['a'][0]
+    z     = props['z'][0]
+    H     = props['H'][0]
+    d_hor = props['d_hor'][0]
+    d_H   = props['d_H'][0]
+    R     = props['R'][0]
+    T     = props['T'][0]
+    RGB   = props['RGB'][0]
+    E     = props['E'][0]
+    rho   = props['rho'][0]
+    xe    = props['xe'][0]
+    mfp   = props['mfp'][0]
+    n_ph  = props['n_ph'][0]
+    nbar  = props['nbar'][0]
+    Pph   = props['Pph'][0]
+    Pbar  = props['Pbar'][0]
 
     # Print results
     u.c = 2.99792458e10 * u.cm / u.s
@@ -198,9 +169,216 @@ def uniProp(t,                  #Time with unit
         print('              {:.3g}     {:.3g}                {:.3g}  {:.3g} {:.3g}  {:.3g}  {:.3g}                                     {:.3g}   {:.3g}   {:.3g}      {:.3g}    {:.3g}'.format(*numbers))
 
     if showit:
-        dummy = rgb_from_T(T/u.K, ncol=255, showit=True)
+        dummy = rgb_from_T((T/u.K).decompose().value, ncol=255, showit=True)
+
+
+
+def uniProp_batch(times,              #Time(s) with unit
+                  cosmo = Planck15,   #Cosmology, astropy-style
+                  ):
+    """
+    Purpose:
+        Calculate properties of the Universe at many times at once, without
+        printing anything. All epochs share the precomputed tables of the
+        cosmology's CosmoContext, so no root-finding or integration is done
+        per epoch, except for the Saha equation during recombination.
+
+    Usage:
+        >>> from astropy import units as u
+        >>> import numpy as np
+        >>> import timeline
+        >>> props = timeline.uniProp_batch(np.logspace(0,10,1000)*u.yr)
+        >>> props['T']
+
+    Returns:
+        Dictionary of arrays with one entry per time:
+            t      Time
+            epoch  'photon epoch', 'matter epoch' or 'dark energy epoch'
+            a, z   Scale factor and redshift
+            H      Hubble parameter
+            d_hor  Radius of observable Universe (particle horizon)
+            d_H    Hubble distance
+            R      Radius of today's observable Universe
+            T, E   Temperature and energy per particle
+            RGB    RGB color code in the range [0-255], shape (n,3)
+            rho    Energy density
+            xe     Ionized fraction
+            mfp    Photon mean free path
+            n_ph   Photon number density
+            nbar   Baryon number density
+            Pph    Photon pressure
+            Pbar   Baryon pressure
+    """
+    assert (isinstance(times,u.Quantity)) and (times.unit.is_equivalent(u.s)), '\n\nKeyword `times` must have units of time.'
+    t   = np.atleast_1d(times)
+    ctx = cosmoContext(cosmo)
+    assert np.all(t >= 1e-32*u.s),   '\n\nt must be >= the end of inflation, which is assumed to be at 1e-32 s.'
+    assert np.all(t <= ctx.t_0),     "\n\nt must be <= the age of the Universe, which for the chosen cosmology is {:}".format(ctx.t_0)
+
+    # Calculate redshift, density, and temperature
+    photon = t <= ctx.t_eq
+    a      = ctx.scaleFactor(t)
+    z      = 1./a - 1
+    T      = cosmo.Tcmb0 / a
+    rho    = (ctx.rho_eq * (ctx.a_eq/a)**4).to(u.g/u.cm**3)
+    if not photon.all():
+        rho[~photon] = cosmo.critical_density(z[~photon])
+    epoch  = np.where(photon, 'photon epoch', np.where(t < ctx.t_DE, 'matter epoch', 'dark energy epoch'))
+
+    # More properties
+    H    = cosmo.H(z)                       #Hubble parameter
+    d_hor = dP(z,cosmo)                     # Horizon distance at t
+    d_H   = cc.c / H                        # Hubble radius at t
+    Pph  = photonPressure(T)                #Photon pressure
+    R    = a * ctx.R0                       #Radius of Universe at end of inflation
+    rhob = cosmo.critical_density0 * cosmo.Ob0 / a**3   #Baryon density at t
+    n_ph = nph(T)                           #Photon number desity
+    X    = .75                              #Primordial hydrogen mass fraction
+    Y    = 1 - X                            #Primordial helium
+    mu   = 1 / (X + Y/4)                    #Mean molecular mass per ion
+    nbar = rhob / (mu*cc.m_p)               #Number density of baryons
+    Pbar = nbar * cc.k_B * T                #Baryon pressure
+    RGB  = np.array([rgb_from_T(Ti, ncol=255) for Ti in (T/u.K).value]) #RGB color code
+    E    = cc.k_B * T                       #Energy per particle
+
+    # Calculate ionization fraction and resulting mean free path of photons
+    xe   = ionizedFraction(T, cosmo)
+    mfp  = meanFreePath(rhob,xe,X)
+
+    return {'t': t, 'epoch': epoch, 'a': a, 'z': z, 'H': H, 'd_hor': d_hor,
+            'd_H': d_H, 'R': R, 'T': T, 'E': E, 'RGB': RGB, 'rho': rho,
+            'xe': xe, 'mfp': mfp, 'n_ph': n_ph, 'nbar': nbar, 'Pph': Pph,
+            'Pbar': Pbar}
 
 
+class CosmoContext:
+    """
+    Quantities of a cosmology that do not depend on time, computed once.
+
+    Besides the radiation-matter and matter-dark energy equalities, tables
+    of age and conformal time are integrated on grids in log(1+z) from z_rad,
+    where the Universe is radiation dominated and the age is 1/(2H), down to
+    today, and interpolated to convert between age, redshift, and conformal
+    time. Before equality, the scale factor is taken to grow as sqrt(t), as
+    in uniProp, while the age of a redshift is that of the cosmology, so that
+    dP(z) is the particle horizon at the age of redshift z.
+
+    Use cosmoContext(cosmo) rather than creating one directly, so that the
+    context is shared between calls.
+    """
+    z_rad = 1e13    # Above this, matter changes the age by less than 1e-9
+
+    def __init__(self, cosmo, nz=80000):
+        self.cosmo  = cosmo
+
+        # Radiation-matter equality
+        self.a_eq   = newton(a_eqSolver,3400.,args=(cosmo,))
+        self.z_eq   = 1/self.a_eq - 1
+        self.rho_eq = cosmo.critical_density(self.z_eq)
+
+        # Matter-dark energy equality
+        self.a_DE   = (cosmo.Om0 / cosmo.Ode0)**.3333333
+        self.z_DE   = 1/self.a_DE - 1
+        self.t_DE   = cosmo.age(self.z_DE).to(u.Gyr)
+
+        self.t_0    = cosmo.age(0)
+        self.R0     = cosmo.comoving_distance(2.7e7)   #Distance in cm to particle horizon today; the 2.7e7 is roughly the highest redshift it can take, but using 1e7, or even 1e6 or 1e4 gives almost the same result
+
+        # Age from z_rad down to equality, and age and conformal time from
+        # equality down to today, using dt = -dz / ((1+z) H) and
+        # deta = dt / a = -dz / H
+        lnzp1   = np.linspace(np.log1p(self.z_rad), np.log1p(self.z_eq), nz)
+        invH    = (1 / cosmo.H(np.expm1(lnzp1))).to(u.s).value
+        self._lnt_rad   = np.log(invH[0]/2 + _cumulativeIntegral(invH, -np.diff(lnzp1)))
+        self._lnzp1_rad = lnzp1
+        self.t_eq   = (np.exp(self._lnt_rad[-1]) * u.s).to(u.yr)
+
+        lnzp1   = np.linspace(np.log1p(self.z_eq), 0, nz)
+        zp1     = np.exp(lnzp1)
+        invH    = (1 / cosmo.H(zp1-1)).to(u.s).value
+        t_eq_s  = self.t_eq.to(u.s).value
+        self._lnt   = np.log(t_eq_s + _cumulativeIntegral(invH, -np.diff(lnzp1)))
+        self._lnzp1 = lnzp1
+        self._eta   = 2*t_eq_s/self.a_eq + _cumulativeIntegral(zp1*invH, -np.diff(lnzp1))
+
+    def scaleFactor(self, t):
+        """Scale factor at time(s) t"""
+        t    = np.atleast_1d(t.to(u.s).value)
+        t_eq = self.t_eq.to(u.s).value
+        a    = np.empty_like(t)
+        photon    = t <= t_eq
+        a[photon] = self.a_eq * sqrt(t[photon]/t_eq)
+        a[~photon] = np.exp(-np.interp(np.log(t[~photon]), self._lnt, self._lnzp1))
+        return a
+
+    def age(self, z):
+        """Age of the Universe at redshift(s) z"""
+        lnzp1  = np.log1p(np.atleast_1d(z))
+        t      = np.empty_like(lnzp1)
+        rad    = lnzp1 >= self._lnzp1_rad[0]
+        photon = (lnzp1 >= self._lnzp1[0]) & ~rad
+        matter = ~photon & ~rad
+        t[rad]    = (.5 / self.cosmo.H(np.expm1(lnzp1[rad]))).to(u.s).value
+        t[photon] = np.exp(np.interp(-lnzp1[photon], -self._lnzp1_rad, self._lnt_rad))
+        t[matter] = np.exp(np.interp(-lnzp1[matter], -self._lnzp1, self._lnt))
+        return t * u.s
+
+    def conformalTime(self, t):
+        """Conformal time, i.e. integral of dt/a from 0 to t"""
+        t    = np.atleast_1d(t.to(u.s).value)
+        t_eq = self.t_eq.to(u.s).value
+        eta  = np.empty_like(t)
+        photon      = t <= t_eq
+        eta[photon]  = 2 * sqrt(t[photon]*t_eq) / self.a_eq
+        eta[~photon] = np.interp(np.log(t[~photon]), self._lnt, self._eta)
+        return eta * u.s
+
+
+def _cumulativeIntegral(f, dx):
+    """
+    Cumulative integral of the positive samples f with steps dx, starting at
+    0. Between samples f is taken to vary exponentially, which is exact for
+    power laws of 1+z on a grid in log(1+z).
+    """
+    ratio = f[1:] / f[:-1]
+    lnratio = np.log(ratio)
+    small = np.abs(lnratio) < 1e-8
+    step = np.where(small, f[:-1], (f[1:] - f[:-1]) / np.where(small, 1., lnratio)) * dx
+    return np.concatenate(([0.], np.cumsum(step)))
+
+
+_contexts = {}
+
+def cosmoContext(cosmo):
+    """
+    Return the CosmoContext of a cosmology, creating it on first use.
+    Cosmologies are not hashable, so contexts are looked up by identity.
+    """
+    if id(cosmo) not in _contexts:
+        _contexts[id(cosmo)] = (cosmo, CosmoContext(cosmo))
+    return _contexts[id(cosmo)][1]
+
+
+def photonPressure(T):
+    """Photon pressure"""
+    return (pi**2 * cc.k_B**4 / (45 * cc.c**3 * cc.h**3) * T**4)
+
+
+def nph(T):
+    """Photon number density"""
+    return 16 * pi * (cc.k_B*T / (cc.h*cc.c))**3 * zeta(3)
+
+
+def ionizedFraction(T,cosmo):
+    """Ionized fraction from the Saha equation, for temperature(s) T"""
+    T    = np.atleast_1d((T/u.K).decompose().value)
+    xe   = np.where(T > 4500, 1., 1e-10)
+    saha = (T <= 4500) & (T > 500)
+    if saha.any():
+        x0       = np.where(T[saha] > 2500, .999, .5)
+        xe[saha] = newton(Saha,x0,args=(T[saha],cosmo))
+    return xe
+
 
 def mue(X):
     """Mean molecular mass per electron"""
@@ -226,23 +404,8 @@ def dP(z,cosmo):
     """
     Particle horizon
     """
-    from astropy.cosmology import z_at_value
-
-  # a_eq = (cosmo.Onu0 + cosmo.Ogamma0) / cosmo.Om0
-    a_eq = newton(a_eqSolver,3400.,args=(cosmo,))
-    z_eq = 1/a_eq - 1
-    t_eq = cosmo.age(z_eq).to(u.s).value
-
-    def inva(t):
-        if t <= t_eq:
-          # a = sqrt(2 * sqrt(cosmo.Onu0+cosmo.Ogamma0) * (cosmo.H0 * t).decompose()).value
-            a = a_eq * sqrt(t/t_eq)
-        else:
-            z = z_at_value(cosmo.age, t*u.s, zmax=1e4)
-            a = cosmo.scale_factor(z)
-        return 1 / a
-
-    eta,err = sp.integrate.quad(inva,0,cosmo.age(z).to(u.s).value) * u.s
+    ctx = cosmoContext(cosmo)
+    eta = ctx.conformalTime(ctx.age(z)).reshape(np.shape(z))
 
     return cc.c * eta / (1+z)
 
@@ -257,13 +420,42 @@ def a_eqSolver(a,cosmo):
 
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument('time',                         type=float, help='Time quantity')
-    parser.add_argument('unit',                         type=str,   help='Time unit (s,min,day,yr,kyr,Myr,Gyr)')
+    parser.add_argument('time',     nargs='?',          type=float, help='Time quantity')
+    parser.add_argument('unit',     nargs='?',          type=str,   help='Time unit (s,min,day,yr,kyr,Myr,Gyr)')
     parser.add_argument('-Runit',   default='',         type=str,   help='Unit for distances (not exactly sure why this works)')
     parser.add_argument('-cosmo',   default='Planck15', type=str,   help='Cosmology (WMAP5, WMAP7, WMAP9, Planck13, Planck15). Default is Planck15')
     parser.add_argument('-showcol', action='store_true',            help='Show color in separate window')
+    parser.add_argument('-range',   nargs=3,            type=str,   help='Batch mode: START STOP NUM, e.g. "1e-32 s" "13.79 Gyr" 1000', metavar=('START','STOP','NUM'))
+    parser.add_argument('-log',     action='store_true',            help='Batch mode: space -range times logarithmically')
+    parser.add_argument('-file',    default='',         type=str,   help='Batch mode: file with one time per line, e.g. "380 kyr"')
+    parser.add_argument('-out',     default='',         type=str,   help='Batch mode: output table (.csv, .json or .parquet)')
+    parser.add_argument('-nproc',   default=0,          type=int,   help='Batch mode: number of processes. Default is all cores')
     args = parser.parse_args()
 
+    #Set cosmology
+    if args.cosmo in COSMOLOGIES:
+        cosmo = COSMOLOGIES[args.cosmo]
+    else:
+        print("Sorry, cosmology `"+args.cosmo+"` is not implemented.\nYou're welcome to go ahead and do it yourself,\nand then send me a pull request.")
+        exit()
+
+    # Batch mode
+    if args.range or args.file:
+        if args.out.rsplit('.',1)[-1].lower() not in ('csv','json','parquet'):
+            parser.error('batch mode needs an output table, given with -out, ending in .csv, .json or .parquet')
+        if args.out.lower().endswith('.parquet'):
+            try:
+                import pandas, pyarrow
+            except ImportError:
+                parser.error('writing .parquet tables needs pandas and pyarrow')
+        times = batchTimes(args.range, args.file, args.log)
+        props = timelineTable(times, cosmo=cosmo, nproc=args.nproc or None)
+        writeTable(props, args.out)
+        print('Wrote {:d} epochs to {:}'.format(len(times), args.out))
+        return
+    if args.time is None or args.unit is None:
+        parser.error('give a time and a unit, or -range/-file for batch mode')
+
     # Set time unit
     if args.unit == 's':
         time  = args.time * u.s
@@ -294,256 +486,124 @@ def main():
     if args.Runit != '':
         Runit = args.Runit
 
-    #Set cosmology
-    if args.cosmo == 'WMAP5':
-        cosmo = WMAP5
-    elif args.cosmo == 'WMAP7':
-        cosmo = WMAP7
-    elif args.cosmo == 'WMAP9':
-        cosmo = WMAP9
-    elif args.cosmo == 'Planck13':
-        cosmo = Planck13
-    elif args.cosmo == 'Planck15':
-        cosmo = Planck15
-    else:
-        print("Sorry, cosmology `"+args.cosmo+"` is not implemented.\nYou're welcome to go ahead and do it yourself,\nand then send me a pull request.")
-        exit()
-
     # Calculate it!
     uniProp(t=time, Runit=Runit, cosmo=cosmo, showit=args.showcol)
 
 
-def planck(lam, T):
+COSMOLOGIES = {'WMAP5': WMAP5, 'WMAP7': WMAP7, 'WMAP9': WMAP9, 'Planck13': Planck13, 'Planck15': Planck15}
+
+
+# Columns of the batch timeline table: name, key in uniProp_batch output, and unit
+TABLE_COLUMNS = [('t_yr',         't',     u.yr),
+                 ('epoch',        'epoch', None),
+                 ('a',            'a',     None),
+                 ('z',            'z',     None),
+                 ('T_K',          'T',     u.K),
+                 ('E_eV',         'E',     u.eV),
+                 ('R',            'RGB',   0),
+                 ('G',            'RGB',   1),
+                 ('B',            'RGB',   2),
+                 ('d_hor_Mpc',    'd_hor', u.Mpc),
+                 ('R_Mpc',        'R',     u.Mpc),
+                 ('d_H_Mpc',      'd_H',   u.Mpc),
+                 ('H_km/s/Mpc',   'H',     u.km/u.s/u.Mpc),
+                 ('rho_g/cm3',    'rho',   u.g/u.cm**3),
+                 ('xe',           'xe',    None),
+                 ('mfp_Gpc',      'mfp',   u.Gpc),
+                 ('n_ph_cm-3',    'n_ph',  u.cm**(-3)),
+                 ('nbar_cm-3',    'nbar',  u.cm**(-3)),
+                 ('Pph_atm',      'Pph',   cds.atm),
+                 ('Pbar_atm',     'Pbar',  cds.atm)]
+
+
+def batchTimes(trange=None, tfile='', log=False):
     """
-    Spectral radiance of a blackbody of temperature T.
-
-    Keywords
-    -------
-    lam     Wavelength in nm
-    T       Temperature in K
-
-    Returns
-    -------
-    Spectral radiance in cgs units (erg/s/sr/cm2)
+    Times for batch mode, from a -range START STOP NUM triplet, where START
+    and STOP are quantities like "1e-32 s", and/or a file with one such
+    quantity per line. Blank lines and lines starting with # are skipped.
     """
-    lam = lam * u.nm
-    x   = cc.h * cc.c / lam / cc.k_B / (T*u.K)
-    B   = 2*cc.h*cc.c**2 / lam**5 / (exp(x) - 1)
-    return B.cgs.value
-
-
-def rgb_from_T(T,std=False,ncol=1,showit=False):
+    times = []
+    if trange:
+        start,stop,num = u.Quantity(trange[0]), u.Quantity(trange[1]), int(trange[2])
+        space = np.geomspace if log else np.linspace
+        times.append(space(start.to(u.s).value, stop.to(u.s).value, num))
+    if tfile:
+        with open(tfile) as f:
+            lines = [line.strip() for line in f]
+        times.append(np.array([u.Quantity(line).to(u.s).value for line in lines
+                               if line and not line.startswith('#')]))
+    return np.concatenate(times) * u.s
+
+
+def timelineTable(times, cosmo=Planck15, nproc=None):
     """
-    Calculate RGB color of a Planck spectrum of temperature T.
-    See rgb.__doc__ for a description of keywords.
+    Evaluate uniProp_batch for many times, split in chunks over nproc
+    processes (default all cores). Each process builds the CosmoContext once,
+    and the chunks are put back together in the order of `times`.
     """
-    lam = np.linspace(350,800,100)
-    B   = planck(lam,T)
-
-    if showit:
-        RGB = rgb(lam,B,std=std,ncol=1,showit=False)
-    else:
-        if T < 670:
-            RGB = np.array([1,0,0])
-        elif 670 <= T < 675:
-            RGB = rgb(lam,B,std=std,ncol=1,showit=False)
-            RGB[2] = 0
-        elif 675 <= T < 1e7:
-            RGB = rgb(lam,B,std=std,ncol=1,showit=False)
+    nproc = nproc or multiprocessing.cpu_count()
+    if nproc == 1 or len(times) < 2*nproc:
+        return uniProp_batch(times, cosmo=cosmo)
+
+    chunks = np.array_split(times.to(u.s).value, 4*nproc)
+    with multiprocessing.Pool(nproc, initializer=_initWorker, initargs=(cosmo,)) as pool:
+        parts = pool.map(_batchWorker, chunks)
+
+    props = {}
+    for key in parts[0]:
+        values = [part[key] for part in parts]
+        if isinstance(values[0], u.Quantity):
+            props[key] = np.concatenate([v.to(values[0].unit).value for v in values]) * values[0].unit
         else:
-            RGB = np.array([0.63130101, 0.71233531, 1.])
-    return ncol * RGB
+            props[key] = np.concatenate(values)
+    return props
 
 
-def rgb(lam,spec,std=False,ncol=1,showit=False):
-    """
-    Return RGB color of a spectrum.
-
-    Keywords
-    --------
-    lam:        Wavelength in nm
-    spec:       Radiance, or intensity, or brightness, or luminosity, or
-                whatever quantity with units that are sorta kinda
-                energy/s/sterad/cm2/wavelength. Normalization doesn't matter.
-    ncol:       Normalization constant, e.g. set ncol=255 for color range [0-255]
-    """
-    x,y = xy(lam,spec)
-    z   = 1 - x - y
-    Y   = 1.
-    X   = (Y/y) * x
-    Z   = (Y/y) * z
-    XYZ = np.array([X,Y,Z])
-
-    # Matrix for Wide RGB D65 conversion
-    if std:
-        XYZ2RGB = np.array([[ 3.2406, -1.5372, -0.4986],
-                            [-0.9689,  1.8758,  0.0415],
-                            [ 0.0557, -0.2040,  1.0570]])
-    else:
-        XYZ2RGB = np.array([[ 1.656492, -0.354851, -0.255038],
-                            [-0.707196,  1.655397,  0.036152],
-                            [ 0.051713, -0.121364,  1.011530]])
+_workerCosmo = None
 
-    RGB = np.dot(XYZ2RGB,XYZ)                   #Map XYZ to RGB
-    RGB = adjust_gamma(RGB)                     #Adjust gamma
-  # RGB = RGB / np.array([0.9505, 1., 1.0890])  #Scale so that Y of "white" (D65) is (0.9505, 1.0000, 1.0890)
-    maxRGB = max(RGB.flatten())
-    if maxRGB > 1: RGB = RGB / maxRGB           #Normalize to 1 if there are values above
-    RGB = RGB.clip(min=0)                       #Clip negative values
+def _initWorker(cosmo):
+    global _workerCosmo
+    _workerCosmo = cosmo
 
-    if showit:
-        import matplotlib.pyplot as plt
-        import matplotlib.patches as patches
-        plt.close('all')
-        fig,ax = plt.subplots(figsize=plt.figaspect(1))
-      # wm = plt.get_current_fig_manager()
-      # wm.window.wm_geometry('100x100+700+550')
-        ax.set_xticks([])
-        ax.set_xticklabels('')
-        ax.set_yticks([])
-        ax.set_yticklabels('')
-        ax.set_xlim([0,1])
-        ax.set_ylim([0,1])
-        rgba = [RGB[0], RGB[1], RGB[2], 1.]
-        rect = patches.Rectangle((0,0),1,1, edgecolor='none',facecolor=rgba)
-        ax.add_patch(rect)
-        plt.tight_layout()
-        plt.draw()
-        plt.show()
-        input("Hit Enter to quit")
-        plt.close()
-
-
-    RGB = ncol * RGB                            #Normalize to number of colors
-
-    return RGB
-
-
-def xy(lam,L):
-    """
-    Return x,y position in CIE 1931 color space chromaticity diagram for an
-    arbitrary spectrum.
 
-    Keywords
-    -------
-    lam:    Wavelength in nm
-    L:      Spectral radiance
-    """
-    lamcie,xbar,ybar,zbar = cie()               #Color matching functions
-    L = np.interp(lamcie,lam,L)                 #Interpolate to same axis
-
-    #Tristimulus values
-    X = simps(L*xbar,lamcie)
-    Y = simps(L*ybar,lamcie)
-    Z = simps(L*zbar,lamcie)
-    XYZ = np.array([X,Y,Z])
-    x = X / sum(XYZ)
-    y = Y / sum(XYZ)
-    z = Z / sum(XYZ)
-    return x,y
-    
-
-
-def cie():
-    """
-    Color matching functions. Columns are wavelength in nm, and xbar, ybar,
-    and zbar, are the functions for R, G, and B, respectively.
-    """
-    lxyz = np.array([[380., 0.0014, 0.0000, 0.0065],
-                     [385., 0.0022, 0.0001, 0.0105],
-                     [390., 0.0042, 0.0001, 0.0201],
-                     [395., 0.0076, 0.0002, 0.0362],
-                     [400., 0.0143, 0.0004, 0.0679],
-                     [405., 0.0232, 0.0006, 0.1102],
-                     [410., 0.0435, 0.0012, 0.2074],
-                     [415., 0.0776, 0.0022, 0.3713],
-                     [420., 0.1344, 0.0040, 0.6456],
-                     [425., 0.2148, 0.0073, 1.0391],
-                     [430., 0.2839, 0.0116, 1.3856],
-                     [435., 0.3285, 0.0168, 1.6230],
-                     [440., 0.3483, 0.0230, 1.7471],
-                     [445., 0.3481, 0.0298, 1.7826],
-                     [450., 0.3362, 0.0380, 1.7721],
-                     [455., 0.3187, 0.0480, 1.7441],
-                     [460., 0.2908, 0.0600, 1.6692],
-                     [465., 0.2511, 0.0739, 1.5281],
-                     [470., 0.1954, 0.0910, 1.2876],
-                     [475., 0.1421, 0.1126, 1.0419],
-                     [480., 0.0956, 0.1390, 0.8130],
-                     [485., 0.0580, 0.1693, 0.6162],
-                     [490., 0.0320, 0.2080, 0.4652],
-                     [495., 0.0147, 0.2586, 0.3533],
-                     [500., 0.0049, 0.3230, 0.2720],
-                     [505., 0.0024, 0.4073, 0.2123],
-                     [510., 0.0093, 0.5030, 0.1582],
-                     [515., 0.0291, 0.6082, 0.1117],
-                     [520., 0.0633, 0.7100, 0.0782],
-                     [525., 0.1096, 0.7932, 0.0573],
-                     [530., 0.1655, 0.8620, 0.0422],
-                     [535., 0.2257, 0.9149, 0.0298],
-                     [540., 0.2904, 0.9540, 0.0203],
-                     [545., 0.3597, 0.9803, 0.0134],
-                     [550., 0.4334, 0.9950, 0.0087],
-                     [555., 0.5121, 1.0000, 0.0057],
-                     [560., 0.5945, 0.9950, 0.0039],
-                     [565., 0.6784, 0.9786, 0.0027],
-                     [570., 0.7621, 0.9520, 0.0021],
-                     [575., 0.8425, 0.9154, 0.0018],
-                     [580., 0.9163, 0.8700, 0.0017],
-                     [585., 0.9786, 0.8163, 0.0014],
-                     [590., 1.0263, 0.7570, 0.0011],
-                     [595., 1.0567, 0.6949, 0.0010],
-                     [600., 1.0622, 0.6310, 0.0008],
-                     [605., 1.0456, 0.5668, 0.0006],
-                     [610., 1.0026, 0.5030, 0.0003],
-                     [615., 0.9384, 0.4412, 0.0002],
-                     [620., 0.8544, 0.3810, 0.0002],
-                     [625., 0.7514, 0.3210, 0.0001],
-                     [630., 0.6424, 0.2650, 0.0000],
-                     [635., 0.5419, 0.2170, 0.0000],
-                     [640., 0.4479, 0.1750, 0.0000],
-                     [645., 0.3608, 0.1382, 0.0000],
-                     [650., 0.2835, 0.1070, 0.0000],
-                     [655., 0.2187, 0.0816, 0.0000],
-                     [660., 0.1649, 0.0610, 0.0000],
-                     [665., 0.1212, 0.0446, 0.0000],
-                     [670., 0.0874, 0.0320, 0.0000],
-                     [675., 0.0636, 0.0232, 0.0000],
-                     [680., 0.0468, 0.0170, 0.0000],
-                     [685., 0.0329, 0.0119, 0.0000],
-                     [690., 0.0227, 0.0082, 0.0000],
-                     [695., 0.0158, 0.0057, 0.0000],
-                     [700., 0.0114, 0.0041, 0.0000],
-                     [705., 0.0081, 0.0029, 0.0000],
-                     [710., 0.0058, 0.0021, 0.0000],
-                     [715., 0.0041, 0.0015, 0.0000],
-                     [720., 0.0029, 0.0010, 0.0000],
-                     [725., 0.0020, 0.0007, 0.0000],
-                     [730., 0.0014, 0.0005, 0.0000],
-                     [735., 0.0010, 0.0004, 0.0000],
-                     [740., 0.0007, 0.0002, 0.0000],
-                     [745., 0.0005, 0.0002, 0.0000],
-                     [750., 0.0003, 0.0001, 0.0000],
-                     [755., 0.0002, 0.0001, 0.0000],
-                     [760., 0.0002, 0.0001, 0.0000],
-                     [765., 0.0001, 0.0000, 0.0000],
-                     [770., 0.0001, 0.0000, 0.0000],
-                     [775., 0.0001, 0.0000, 0.0000],
-                     [780., 0.0000, 0.0000, 0.0000]])
-    return lxyz.T
-
-
-def adjust_gamma(RGB):
+def _batchWorker(chunk):
+    return uniProp_batch(chunk*u.s, cosmo=_workerCosmo)
+
+
+def writeTable(props, filename):
     """
-    Adjust gamma value of RGB color
+    Write the output of uniProp_batch as a table with the columns in
+    TABLE_COLUMNS. The format is given by the extension of filename: .csv,
+    .json (list of records) or .parquet (needs pandas with pyarrow).
     """
-    a = 0.055
-    for i,color in enumerate(RGB):
-        if color <= 0.0031308:
-            RGB[i] = 12.92 * color
+    columns = {}
+    for name,key,unit in TABLE_COLUMNS:
+        if isinstance(unit, int):
+            columns[name] = props[key][:,unit]
+        elif unit is None:
+            columns[name] = np.asarray(props[key])
         else:
-            RGB[i] = (1+a) * color**(1/2.4) - a
-    return RGB
+            columns[name] = props[key].to(unit).value
+
+    ext = filename.rsplit('.',1)[-1].lower()
+    if ext == 'csv':
+        with open(filename, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(columns.keys())
+            writer.writerows(zip(*[col.tolist() for col in columns.values()]))
+    elif ext == 'json':
+        records = [dict(zip(columns.keys(), row)) for row in zip(*[col.tolist() for col in columns.values()])]
+        with open(filename, 'w') as f:
+            json.dump(records, f)
+    elif ext == 'parquet':
+        try:
+            import pandas as pd
+        except ImportError:
+            raise ImportError('Writing .parquet tables needs pandas and pyarrow')
+        pd.DataFrame(columns).to_parquet(filename)
+    else:
+        raise ValueError('Unknown table format `{:}`, use .csv, .json or .parquet'.format(ext))
+
 
 if __name__ == '__main__':
     main()